@@ -1,4 +1,22 @@
+from array import array
+from bisect import bisect_right
+import csv
+from itertools import islice
+import json
+from operator import index
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только для as_numpy()
+    np = None
+
+
 class Book:
+    __slots__ = ('_id', '_title', '_authors', '_publisher', '_year',
+                 '_page_count', '_price', '_binding_type', '_key', '_fuzzy_key')
+
     def __init__(self, id=None, title=None, authors=None, publisher=None, 
                  year=None, page_count=None, price=None, binding_type=None):
         self._id = id
@@ -9,6 +27,9 @@ class Book:
         self._page_count = page_count
         self._price = price
         self._binding_type = binding_type
+        # Кэш ключей для поиска дубликатов (сбрасывается сеттерами)
+        self._key = None
+        self._fuzzy_key = None
 
     # Альтернативный конструктор
     @classmethod
@@ -30,48 +51,56 @@ class Book:
     
     def setId(self, id):
         self._id = id
+        self._key = self._fuzzy_key = None
         
     def getTitle(self):
         return self._title
     
     def setTitle(self, title):
         self._title = title
+        self._key = self._fuzzy_key = None
         
     def getAuthors(self):
         return self._authors
     
     def setAuthors(self, authors):
         self._authors = authors
+        self._key = self._fuzzy_key = None
         
     def getPublisher(self):
         return self._publisher
     
     def setPublisher(self, publisher):
         self._publisher = publisher
+        self._key = self._fuzzy_key = None
         
     def getYear(self):
         return self._year
     
     def setYear(self, year):
         self._year = year
+        self._key = self._fuzzy_key = None
         
     def getPage_count(self):
         return self._page_count
     
     def setPage_count(self, page_count):
         self._page_count = page_count
+        self._key = self._fuzzy_key = None
         
     def getPrice(self):
         return self._price
     
     def setPrice(self, price):
         self._price = price
+        self._key = self._fuzzy_key = None
         
     def getBinding_type(self):
         return self._binding_type
     
     def setBinding_type(self, binding_type):
         self._binding_type = binding_type
+        self._key = self._fuzzy_key = None
 
     # Переопределение методов
     def __str__(self):
@@ -80,18 +109,29 @@ class Book:
                 f"year={self._year}, page_count={self._page_count}, "
                 f"price={self._price}, binding_type='{self._binding_type}')")
     
+    # Точный ключ, согласованный с __eq__
+    def getKey(self):
+        if self._key is None:
+            self._key = (
+                self._id,
+                self._title,
+                tuple(self._authors) if isinstance(self._authors, list) else self._authors,
+                self._publisher,
+                self._year,
+                self._page_count,
+                self._price,
+                self._binding_type
+            )
+        return self._key
+
+    # Нормализованные название и авторы для нечеткого поиска дубликатов
+    def getFuzzyKey(self):
+        if self._fuzzy_key is None:
+            self._fuzzy_key = _fuzzy_key(self._title, self._authors)
+        return self._fuzzy_key
+
     def __hash__(self):
-        # Более надежная реализация хэша
-        return hash((
-            self._id, 
-            self._title.lower() if self._title else None,
-            tuple(self._authors) if isinstance(self._authors, list) else self._authors,
-            self._publisher.lower() if self._publisher else None,
-            self._year,
-            self._page_count,
-            self._price,
-            self._binding_type.lower() if self._binding_type else None
-        ))
+        return hash(self.getKey())
     
     def __eq__(self, other):
         if not isinstance(other, Book):
@@ -106,33 +146,366 @@ class Book:
                 self._binding_type == other._binding_type)
 
 
-class BookManager:
+# Колоночное хранилище: числовые поля в типизированных массивах,
+# строки интернированы, объекты Book создаются только при обращении.
+# books[i] - новая копия строки: ее сеттеры не меняют хранилище
+class BookColumns:
+    # Биты маски пустых (None) числовых полей
+    _NULL_ID, _NULL_YEAR, _NULL_PAGES, _NULL_PRICE = 1, 2, 4, 8
+
+    __slots__ = ('ids', 'years', 'page_counts', 'prices', 'nulls',
+                 'titles', 'authors', 'publishers', 'binding_types')
+
     def __init__(self):
-        self.books = []
+        self.ids = array('q')
+        self.years = array('q')
+        self.page_counts = array('q')
+        self.prices = array('d')
+        self.nulls = bytearray()
+        self.titles = []
+        self.authors = []
+        self.publishers = []
+        self.binding_types = []
+
+    def append(self, book):
+        self.append_values(book.getId(), book.getTitle(), book.getAuthors(),
+                           book.getPublisher(), book.getYear(), book.getPage_count(),
+                           book.getPrice(), book.getBinding_type())
+
+    def append_values(self, id, title, authors, publisher, year, page_count,
+                      price, binding_type):
+        # Сначала проверяются все значения, затем дополняются колонки:
+        # ошибка в любом поле не оставляет колонки разной длины
+        nulls = 0
+        if id is None:
+            nulls |= self._NULL_ID
+        if year is None:
+            nulls |= self._NULL_YEAR
+        if page_count is None:
+            nulls |= self._NULL_PAGES
+        if price is None:
+            nulls |= self._NULL_PRICE
+        id = _as_int64(id, 'id')
+        year = _as_int64(year, 'year')
+        page_count = _as_int64(page_count, 'page_count')
+        price = _as_double(price, 'price')
+        if isinstance(authors, list):
+            authors = [_intern(name) for name in authors]
+        else:
+            authors = _intern(authors)
+        self.ids.append(id)
+        self.years.append(year)
+        self.page_counts.append(page_count)
+        self.prices.append(price)
+        self.nulls.append(nulls)
+        self.titles.append(_intern(title))
+        self.authors.append(authors)
+        self.publishers.append(_intern(publisher))
+        self.binding_types.append(_intern(binding_type))
+
+    def year_at(self, row):
+        return None if self.nulls[row] & self._NULL_YEAR else self.years[row]
+
+    def row_key(self, row):
+        nulls = self.nulls[row]
+        authors = self.authors[row]
+        return (
+            None if nulls & self._NULL_ID else self.ids[row],
+            self.titles[row],
+            tuple(authors) if isinstance(authors, list) else authors,
+            self.publishers[row],
+            None if nulls & self._NULL_YEAR else self.years[row],
+            None if nulls & self._NULL_PAGES else self.page_counts[row],
+            None if nulls & self._NULL_PRICE else self.prices[row],
+            self.binding_types[row]
+        )
+
+    def as_numpy(self, column):
+        # Представление числовой колонки без копирования (нужен NumPy)
+        if np is None:
+            raise RuntimeError("NumPy не установлен")
+        dtype = np.float64 if column == 'prices' else np.int64
+        return np.frombuffer(getattr(self, column), dtype=dtype)
+
+    def __len__(self):
+        return len(self.nulls)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        nulls = self.nulls[row]
+        authors = self.authors[row]
+        return Book(
+            None if nulls & self._NULL_ID else self.ids[row],
+            self.titles[row],
+            list(authors) if isinstance(authors, list) else authors,
+            self.publishers[row],
+            None if nulls & self._NULL_YEAR else self.years[row],
+            None if nulls & self._NULL_PAGES else self.page_counts[row],
+            None if nulls & self._NULL_PRICE else self.prices[row],
+            self.binding_types[row]
+        )
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class BookManager:
+    # storage: 'objects' - список объектов Book, 'columnar' - BookColumns
+    def __init__(self, storage='objects'):
+        if storage not in ('objects', 'columnar'):
+            raise ValueError(f"Неизвестный режим хранения: {storage}")
+        self.storage = storage
+        columnar = storage == 'columnar'
+        self.books = BookColumns() if columnar else []
+        # Вторичные индексы: значение -> позиции книг в self.books
+        self._author_index = {}
+        self._publisher_index = {}
+        self._new_bucket = (lambda: array('q')) if columnar else list
+        # Индекс по году: годы и соответствующие позиции. Новые книги
+        # дописываются в конец, сортировка - перед ближайшим запросом
+        self._years = array('q') if columnar else []
+        self._year_rows = array('q') if columnar else []
+        self._years_sorted = True
     
+    # Индексы строятся при добавлении: если книгу из objects-хранилища
+    # изменили (setAuthors, setPublisher, setYear), вызовите rebuild_indexes()
     def add_book(self, book):
+        row = len(self.books)
         self.books.append(book)
+        self._index_book(row, book.getAuthors(), book.getPublisher(), book.getYear())
+    
+    def _index_book(self, row, authors, publisher, year):
+        for author in _split_authors(authors):
+            self._bucket(self._author_index, author).append(row)
+        self._bucket(self._publisher_index, publisher).append(row)
+        if year is not None:
+            self._years.append(year)
+            self._year_rows.append(row)
+            self._years_sorted = False
+    
+    def rebuild_indexes(self):
+        self._author_index = {}
+        self._publisher_index = {}
+        self._years = self._years[:0]
+        self._year_rows = self._year_rows[:0]
+        self._years_sorted = True
+        books = self.books
+        if isinstance(books, BookColumns):
+            fields = zip(books.authors, books.publishers, map(books.year_at, range(len(books))))
+        else:
+            fields = ((book.getAuthors(), book.getPublisher(), book.getYear()) for book in books)
+        for row, (authors, publisher, year) in enumerate(fields):
+            self._index_book(row, authors, publisher, year)
+    
+    def _sort_years(self):
+        if self._years_sorted:
+            return
+        # Сортировка устойчива - одинаковые годы остаются в порядке добавления
+        years, rows = self._years, self._year_rows
+        order = sorted(range(len(years)), key=years.__getitem__)
+        self._years = years[:0]
+        self._years.extend(map(years.__getitem__, order))
+        self._year_rows = rows[:0]
+        self._year_rows.extend(map(rows.__getitem__, order))
+        self._years_sorted = True
+    
+    # Массовая загрузка: книги добавляются пачками, индекс по году
+    # сортируется один раз после загрузки. records - словари (как в from_dict)
+    # или объекты Book. progress(rows, rows_per_sec) вызывается после пачки
+    def add_books(self, records, batch_size=10000, progress=None):
+        started = time.perf_counter()
+        rows = 0
+        for batch in _batched(records, batch_size):
+            self._add_batch(batch)
+            rows += len(batch)
+            if progress is not None:
+                progress(rows, rows / max(time.perf_counter() - started, 1e-9))
+        seconds = time.perf_counter() - started
+        return {
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_sec': rows / seconds if seconds > 0 else 0.0
+        }
+    
+    def load_jsonl(self, filename, batch_size=10000, progress=None):
+        return self.add_books(_read_jsonl(filename), batch_size, progress)
+    
+    def load_csv(self, filename, batch_size=10000, progress=None):
+        return self.add_books(_read_csv(filename), batch_size, progress)
+    
+    def _add_batch(self, batch):
+        columnar = isinstance(self.books, BookColumns)
+        new_years = []
+        new_rows = []
+        try:
+            for row, record in enumerate(batch, len(self.books)):
+                if isinstance(record, Book):
+                    values = (record.getId(), record.getTitle(), record.getAuthors(),
+                              record.getPublisher(), record.getYear(), record.getPage_count(),
+                              record.getPrice(), record.getBinding_type())
+                else:
+                    values = tuple(record.get(field) for field in _BOOK_FIELDS)
+                if columnar:
+                    self.books.append_values(*values)
+                else:
+                    self.books.append(record if isinstance(record, Book) else Book(*values))
+                _, _, authors, publisher, year = values[:5]
+                for author in _split_authors(authors):
+                    self._bucket(self._author_index, author).append(row)
+                self._bucket(self._publisher_index, publisher).append(row)
+                if year is not None:
+                    new_years.append(year)
+                    new_rows.append(row)
+        finally:
+            # Книги пачки до ошибочной записи уже добавлены - индексируем их
+            self._merge_years(new_years, new_rows)
+    
+    def _merge_years(self, new_years, new_rows):
+        if not new_years:
+            return
+        # Пачка дописывается в конец; сортировка одна на все пачки - перед
+        # ближайшим запросом (Timsort сливает готовые отсортированные участки)
+        self._years.extend(new_years)
+        self._year_rows.extend(new_rows)
+        self._years_sorted = False
+    
+    def _bucket(self, index, key):
+        bucket = index.get(key)
+        if bucket is None:
+            bucket = index[key] = self._new_bucket()
+        return bucket
     
     def get_books_by_author(self, author):
-        return [book for book in self.books if author in book.getAuthors()]
+        return [self.books[row] for row in self._author_index.get(author, ())]
     
     def get_books_by_publisher(self, publisher):
-        return [book for book in self.books if book.getPublisher() == publisher]
+        return [self.books[row] for row in self._publisher_index.get(publisher, ())]
     
     def get_books_after_year(self, year):
-        return [book for book in self.books if book.getYear() > year]
+        # Книги возвращаются в порядке возрастания года
+        self._sort_years()
+        start = bisect_right(self._years, year)
+        return [self.books[row] for row in self._year_rows[start:]]
+    
+    # Группы дубликатов: все книги с одинаковым ключом, за один проход.
+    # fuzzy=True сравнивает только нормализованные название и авторов
+    def find_duplicate_groups(self, fuzzy=False):
+        first_rows = {}
+        groups = {}
+        for row, key in enumerate(self._iter_keys(fuzzy)):
+            first = first_rows.setdefault(key, row)
+            if first != row:
+                group = groups.get(first)
+                if group is None:
+                    group = groups[first] = [first]
+                group.append(row)
+        return [[self.books[row] for row in rows] for rows in groups.values()]
     
-    # Дополнительный метод для демонстрации работы с хэшами
-    def find_duplicates(self):
-        seen = {}
+    # Пары (первая книга группы, дубликат)
+    def find_duplicates(self, fuzzy=False):
         duplicates = []
-        for book in self.books:
-            book_hash = hash(book)
-            if book_hash in seen:
-                duplicates.append((seen[book_hash], book))
-            else:
-                seen[book_hash] = book
+        for group in self.find_duplicate_groups(fuzzy):
+            duplicates.extend((group[0], book) for book in group[1:])
         return duplicates
+    
+    def _iter_keys(self, fuzzy):
+        books = self.books
+        if isinstance(books, BookColumns):
+            if fuzzy:
+                return map(_fuzzy_key, books.titles, books.authors)
+            return map(books.row_key, range(len(books)))
+        if fuzzy:
+            return (book.getFuzzyKey() for book in books)
+        return (book.getKey() for book in books)
+
+
+_BOOK_FIELDS = ('id', 'title', 'authors', 'publisher', 'year',
+                'page_count', 'price', 'binding_type')
+_CSV_TYPES = {'id': int, 'year': int, 'page_count': int, 'price': float}
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _read_jsonl(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_csv(filename):
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        for record in csv.DictReader(f):
+            for field, value in record.items():
+                if value == '':
+                    record[field] = None
+                elif field in _CSV_TYPES:
+                    record[field] = _CSV_TYPES[field](value)
+            yield record
+
+
+# Проверки значений для колонок array('q') и array('d') - те же, что
+# делает append массива, но без изменения колонок
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _as_int64(value, field):
+    if value is None:
+        return 0
+    try:
+        value = index(value)
+    except TypeError:
+        raise TypeError(f"{field}: ожидалось целое число, получено {value!r}") from None
+    if not _INT64_MIN <= value <= _INT64_MAX:
+        raise OverflowError(f"{field}: {value} не помещается в 64 бита")
+    return value
+
+
+def _as_double(value, field):
+    if value is None:
+        return 0.0
+    if isinstance(value, (str, bytes, bytearray)):
+        raise TypeError(f"{field}: ожидалось число, получено {value!r}")
+    try:
+        return float(value)
+    except TypeError:
+        raise TypeError(f"{field}: ожидалось число, получено {value!r}") from None
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# Авторы хранятся строкой ("A, B") или списком - приводим к списку имен
+def _split_authors(authors):
+    if authors is None:
+        return []
+    if isinstance(authors, str):
+        return [name.strip() for name in authors.split(',') if name.strip()]
+    return list(authors)
+
+
+def _normalize_text(text):
+    if text is None:
+        return ''
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text.casefold())
+    return ' '.join(text.split())
+
+
+def _fuzzy_key(title, authors):
+    names = (_normalize_text(name) for name in _split_authors(authors))
+    return (_normalize_text(title), tuple(sorted(name for name in names if name)))
 
 
 # Создание массива объектов с использованием разных конструкторов
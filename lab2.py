@@ -1,8 +1,18 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
+import argparse
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import date, datetime
 from enum import Enum
+from functools import lru_cache
 import json
-from typing import List, Dict, Optional
+import math
+from operator import itemgetter
+import os
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Set, Tuple, Type, Union
+import weakref
 
 # ==================== ENUMS ====================
 
@@ -23,6 +33,29 @@ class TaxRate(Enum):
     HIGH = 0.15      # 15% для высоких доходов
     SPECIAL = 0.35   # 35% для специальных видов доходов
 
+# Порог высокого дохода для ставки TaxRate.HIGH
+HIGH_INCOME_THRESHOLD = 5000000
+
+# Типы доходов, облагаемые по специальной ставке
+SPECIAL_RATE_TYPES = (IncomeType.GIFTS, IncomeType.FOREIGN_TRANSFERS)
+
+# Компактные числовые коды типов дохода: порядок объявления в IncomeType,
+# затем типы, добавленные через register_income_class
+INCOME_TYPES: List[IncomeType] = list(IncomeType)
+TYPE_CODES: Dict[IncomeType, int] = {income_type: code for code, income_type in enumerate(INCOME_TYPES)}
+
+# Быстрый поиск типа по коду или сохраненной строке (вместо IncomeType(value))
+TYPES_BY_KEY: Dict[Union[int, str], IncomeType] = {}
+for _code, _income_type in enumerate(INCOME_TYPES):
+    TYPES_BY_KEY[_code] = TYPES_BY_KEY[_income_type.value] = _income_type
+
+def income_type_of(key: Union[int, str]) -> IncomeType:
+    """Тип дохода по числовому коду или строке из to_dict()"""
+    try:
+        return TYPES_BY_KEY[key]
+    except (KeyError, TypeError):
+        raise ValueError(f"Неизвестный тип дохода: {key!r}") from None
+
 # ==================== BASE CLASSES ====================
 
 class Serializable(ABC):
@@ -38,7 +71,22 @@ class Serializable(ABC):
         pass
 
 class Income(Serializable):
-    """Базовый класс для дохода"""
+    """Базовый класс для дохода.
+    
+    Подклассы регистрируются для своих типов дохода через аргумент
+    класса income_types, например:
+    class GiftIncome(Income, income_types=(IncomeType.GIFTS,))
+    
+    Новый вид дохода объявляется своим Enum, без правки IncomeType:
+    class PrizeType(Enum):
+        LOTTERY = "Выигрыши в лотерею"
+    class LotteryIncome(Income, income_types=(PrizeType.LOTTERY,))
+    """
+    
+    def __init_subclass__(cls, income_types: Tuple[Enum, ...] = (), **kwargs):
+        super().__init_subclass__(**kwargs)
+        for income_type in income_types:
+            register_income_class(income_type, cls)
     
     def __init__(self, amount: float, description: str, date: str, income_type: IncomeType):
         self._amount = amount
@@ -68,9 +116,9 @@ class Income(Serializable):
     
     def get_tax_rate(self) -> float:
         """Получить ставку налога для данного типа дохода"""
-        if self.income_type in [IncomeType.GIFTS, IncomeType.FOREIGN_TRANSFERS]:
+        if self.income_type in SPECIAL_RATE_TYPES:
             return TaxRate.SPECIAL.value
-        elif self.amount > 5000000:  # Для доходов свыше 5 млн
+        elif self.amount > HIGH_INCOME_THRESHOLD:  # Для доходов свыше 5 млн
             return TaxRate.HIGH.value
         else:
             return TaxRate.STANDARD.value
@@ -89,16 +137,54 @@ class Income(Serializable):
             amount=data['amount'],
             description=data['description'],
             date=data['date'],
-            income_type=IncomeType(data['income_type'])
+            income_type=income_type_of(data['income_type'])
         )
     
     def __str__(self) -> str:
         return (f"{self.income_type.value}: {self.amount:,.2f} руб. "
                 f"(Налог: {self.calculate_tax():,.2f} руб.)")
 
+# ==================== INCOME REGISTRY ====================
+
+# Фабрики доходов: код типа и сохраненная строка типа -> from_dict класса.
+# Оба ключа ведут к одной фабрике, поэтому разбор записи - один поиск в dict.
+# to_dict пишет строку (файлы остаются читаемыми), from_dict понимает и код
+INCOME_FACTORIES: Dict[Union[int, str], Callable[[Dict], Income]] = {}
+
+def register_income_class(income_type: Enum, income_class: Type[Income]) -> None:
+    """Зарегистрировать класс дохода для типа (можно переопределять).
+    
+    Тип - член IncomeType или другого Enum со строковым значением: новый
+    тип получает следующий свободный код, а калькуляторы заводят для него
+    корзину и итоги при первом доходе этого типа.
+    """
+    if income_type not in TYPE_CODES:
+        if not isinstance(income_type, Enum) or not isinstance(income_type.value, str):
+            raise ValueError(f"Тип дохода должен быть членом Enum со строковым значением: {income_type!r}")
+        if income_type.value in TYPES_BY_KEY:
+            raise ValueError(f"Тип дохода {income_type.value!r} уже зарегистрирован")
+        code = len(INCOME_TYPES)
+        INCOME_TYPES.append(income_type)
+        TYPE_CODES[income_type] = code
+        TYPES_BY_KEY[code] = TYPES_BY_KEY[income_type.value] = income_type
+    factory = income_class.from_dict
+    INCOME_FACTORIES[TYPE_CODES[income_type]] = factory
+    INCOME_FACTORIES[income_type.value] = factory
+
+def income_from_dict(data: Dict) -> Income:
+    """Создать доход подходящего класса по полю income_type"""
+    try:
+        factory = INCOME_FACTORIES[data['income_type']]
+    except KeyError:
+        raise ValueError(f"Неизвестный тип дохода: {data.get('income_type')!r}") from None
+    return factory(data)
+
+for _income_type in INCOME_TYPES:
+    register_income_class(_income_type, Income)
+
 # ==================== SPECIFIC INCOME CLASSES ====================
 
-class EmploymentIncome(Income):
+class EmploymentIncome(Income, income_types=(IncomeType.MAIN_JOB, IncomeType.ADDITIONAL_JOB)):
     """Доход от работы (основной или дополнительной)"""
     
     def __init__(self, amount: float, employer: str, date: str, is_main_job: bool):
@@ -126,7 +212,7 @@ class EmploymentIncome(Income):
             is_main_job=data['is_main_job']
         )
 
-class AuthorIncome(Income):
+class AuthorIncome(Income, income_types=(IncomeType.AUTHOR_FEES,)):
     """Авторские вознаграждения"""
     
     def __init__(self, amount: float, work_title: str, date: str):
@@ -151,7 +237,7 @@ class AuthorIncome(Income):
             date=data['date']
         )
 
-class PropertySaleIncome(Income):
+class PropertySaleIncome(Income, income_types=(IncomeType.PROPERTY_SALES,)):
     """Доход от продажи имущества"""
     
     def __init__(self, amount: float, property_type: str, date: str):
@@ -176,6 +262,120 @@ class PropertySaleIncome(Income):
             date=data['date']
         )
 
+# ==================== AGGREGATES ====================
+
+class IncomeAggregates:
+    """Итоги по доходам: количество, доход и налог по каждому типу"""
+    
+    def __init__(self, counts: List[int], income_by_type: List[float],
+                 tax_by_type: List[float], total_income: float, total_tax: float):
+        self.counts = counts
+        self.income_by_type = income_by_type
+        self.tax_by_type = tax_by_type
+        self.total_income = total_income
+        self.total_tax = total_tax
+
+class PeriodTotals:
+    """Доход и налог за период (месяц, квартал или год)"""
+    
+    def __init__(self, period: str, start: date, end: date, count: int,
+                 total_income: float, total_tax: float):
+        self.period = period
+        self.start = start
+        self.end = end
+        self.count = count
+        self.total_income = total_income
+        self.total_tax = total_tax
+    
+    def __str__(self) -> str:
+        return (f"{self.period}: доход {self.total_income:,.2f} руб., "
+                f"налог {self.total_tax:,.2f} руб. ({self.count})")
+
+@lru_cache(maxsize=4096)
+def parse_date_ordinal(value: str) -> Optional[int]:
+    """Порядковый номер дня для даты 'гггг-мм-дд' или None, если не разобрать"""
+    try:
+        return datetime.fromisoformat(value.strip()).toordinal()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _to_ordinal(value: Union[str, date]) -> int:
+    if isinstance(value, date):
+        return value.toordinal()
+    ordinal = parse_date_ordinal(value)
+    if ordinal is None:
+        raise ValueError(f"Неверный формат даты: {value!r}")
+    return ordinal
+
+def _period_bounds(ordinal: int, period: str) -> Tuple[str, date, date]:
+    """Название периода, его первый день и первый день следующего"""
+    day = date.fromordinal(ordinal)
+    if period == 'year':
+        return str(day.year), date(day.year, 1, 1), date(day.year + 1, 1, 1)
+    if period == 'quarter':
+        first_month = (day.month - 1) // 3 * 3 + 1
+        label = f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+        months = 3
+    elif period == 'month':
+        first_month = day.month
+        label = f"{day.year}-{day.month:02d}"
+        months = 1
+    else:
+        raise ValueError(f"Неизвестный период: {period!r}")
+    next_month = first_month + months
+    next_start = date(day.year + (next_month - 1) // 12, (next_month - 1) % 12 + 1, 1)
+    return label, date(day.year, first_month, 1), next_start
+
+class RunningSum:
+    """Компенсированная сумма с добавлением и вычитанием за O(1).
+    
+    Хранит неперекрывающиеся частичные суммы (как math.fsum), поэтому
+    значение всегда равно точной сумме, округленной один раз, и не
+    накапливает ошибку при многократных добавлениях и удалениях.
+    """
+    
+    __slots__ = ('_partials',)
+    
+    def __init__(self):
+        self._partials: List[float] = []
+    
+    def add(self, value: float) -> None:
+        x = float(value)
+        partials = self._partials
+        i = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                partials[i] = lo
+                i += 1
+            x = hi
+        partials[i:] = [x]
+    
+    def add_many(self, values: List[float]) -> None:
+        """Добавить сразу много значений.
+        
+        Сумма хранится парой (старшая часть, остаток), оба через math.fsum;
+        остаточная погрешность порядка 1e-32 от суммы.
+        """
+        terms = self._partials + values
+        hi = math.fsum(terms)
+        terms.append(-hi)
+        lo = math.fsum(terms)
+        self._partials = [lo, hi] if lo else [hi]
+    
+    def subtract(self, value: float) -> None:
+        self.add(-value)
+    
+    def clear(self) -> None:
+        self._partials = []
+    
+    @property
+    def value(self) -> float:
+        return math.fsum(self._partials)
+
 # ==================== TAX CALCULATOR ====================
 
 class TaxCalculator(Serializable):
@@ -183,35 +383,230 @@ class TaxCalculator(Serializable):
     
     def __init__(self):
         self._incomes: List[Income] = []
+        # Ключ каждого дохода (параллельно _incomes) и корзины по типам:
+        # код типа -> {ключ: доход} в порядке добавления
+        self._keys: List[int] = []
+        self._next_key = 0
+        self._buckets: List[Dict[int, Income]] = [{} for _ in INCOME_TYPES]
+        # Текущие итоги, обновляемые при каждом изменении
+        self._income_sums = [RunningSum() for _ in INCOME_TYPES]
+        self._tax_sums = [RunningSum() for _ in INCOME_TYPES]
+        self._total_income = RunningSum()
+        self._total_tax = RunningSum()
+        # Индекс по дате: номера дней и параллельно ключи и доходы. Записи
+        # только дописываются, удаленные ключи помечаются в _date_removed;
+        # сортировка и чистка - один раз перед ближайшим запросом по датам.
+        # Доходы с неразборчивой датой в индекс не входят
+        self._date_ordinals: List[int] = []
+        self._date_keys: List[int] = []
+        self._date_incomes: List[Income] = []
+        self._date_removed: Set[int] = set()
+        self._dates_dirty = False
+    
+    def _grow_types(self) -> None:
+        """Корзины и итоги для типов, зарегистрированных после создания калькулятора"""
+        for _ in range(len(self._buckets), len(INCOME_TYPES)):
+            self._buckets.append({})
+            self._income_sums.append(RunningSum())
+            self._tax_sums.append(RunningSum())
     
     def add_income(self, income: Income) -> None:
         """Добавить доход"""
+        # Все, что может бросить исключение, - до изменения состояния
+        code = TYPE_CODES[income.income_type]
+        if code >= len(self._buckets):
+            self._grow_types()
+        tax = income.calculate_tax()
+        ordinal = parse_date_ordinal(income.date)
+        key = self._next_key
+        self._next_key += 1
         self._incomes.append(income)
+        self._keys.append(key)
+        self._buckets[code][key] = income
+        self._income_sums[code].add(income.amount)
+        self._tax_sums[code].add(tax)
+        self._total_income.add(income.amount)
+        self._total_tax.add(tax)
+        if ordinal is not None:
+            if self._date_ordinals and ordinal < self._date_ordinals[-1]:
+                self._dates_dirty = True
+            self._date_ordinals.append(ordinal)
+            self._date_keys.append(key)
+            self._date_incomes.append(income)
+    
+    def add_incomes(self, incomes: Iterable[Income]) -> None:
+        """Добавить много доходов (то же, что add_income, с меньшими накладными
+        расходами). Если incomes бросит исключение, доходы до него остаются
+        добавленными целиком - с ключами, итогами и индексом по дате"""
+        append_income = self._incomes.append
+        append_key = self._keys.append
+        buckets = self._buckets
+        amounts: Dict[int, List[float]] = defaultdict(list)
+        taxes: Dict[int, List[float]] = defaultdict(list)
+        date_ordinals = self._date_ordinals
+        last_ordinal = date_ordinals[-1] if date_ordinals else -1
+        dirty = False
+        key = self._next_key
+        try:
+            for income in incomes:
+                code = TYPE_CODES[income.income_type]
+                if code >= len(buckets):
+                    self._grow_types()
+                tax = income.calculate_tax()
+                ordinal = parse_date_ordinal(income.date)
+                append_income(income)
+                append_key(key)
+                buckets[code][key] = income
+                amounts[code].append(income.amount)
+                taxes[code].append(tax)
+                if ordinal is not None:
+                    if ordinal < last_ordinal:
+                        dirty = True
+                    last_ordinal = ordinal
+                    date_ordinals.append(ordinal)
+                    self._date_keys.append(key)
+                    self._date_incomes.append(income)
+                key += 1
+        finally:
+            self._next_key = key
+            if dirty:
+                self._dates_dirty = True
+            # Итоги обновляются один раз на пачку
+            for code, values in amounts.items():
+                self._income_sums[code].add_many(values)
+                self._tax_sums[code].add_many(taxes[code])
+            self._total_income.add_many([value for values in amounts.values() for value in values])
+            self._total_tax.add_many([value for values in taxes.values() for value in values])
     
     def remove_income(self, index: int) -> None:
         """Удалить доход по индексу"""
         if 0 <= index < len(self._incomes):
-            self._incomes.pop(index)
+            income = self._incomes.pop(index)
+            key = self._keys.pop(index)
+            code = TYPE_CODES[income.income_type]
+            del self._buckets[code][key]
+            tax = income.calculate_tax()
+            self._income_sums[code].subtract(income.amount)
+            self._tax_sums[code].subtract(tax)
+            self._total_income.subtract(income.amount)
+            self._total_tax.subtract(tax)
+            if parse_date_ordinal(income.date) is not None:
+                self._date_removed.add(key)
+                self._dates_dirty = True
     
     def get_total_income(self) -> float:
         """Получить общий доход"""
-        return sum(income.amount for income in self._incomes)
+        return self._total_income.value
     
     def get_total_tax(self) -> float:
         """Получить общую сумму налога"""
-        return sum(income.calculate_tax() for income in self._incomes)
+        return self._total_tax.value
     
     def get_income_by_type(self, income_type: IncomeType) -> List[Income]:
         """Получить доходы по типу"""
-        return [income for income in self._incomes if income.income_type == income_type]
+        self._grow_types()
+        return list(self._buckets[TYPE_CODES[income_type]].values())
     
     def get_tax_by_type(self, income_type: IncomeType) -> float:
         """Получить налог по типу дохода"""
-        return sum(income.calculate_tax() for income in self.get_income_by_type(income_type))
+        self._grow_types()
+        return self._tax_sums[TYPE_CODES[income_type]].value
     
     def clear_incomes(self) -> None:
         """Очистить все доходы"""
         self._incomes.clear()
+        self._keys.clear()
+        for bucket in self._buckets:
+            bucket.clear()
+        for running_sum in self._income_sums + self._tax_sums:
+            running_sum.clear()
+        self._total_income.clear()
+        self._total_tax.clear()
+        self._date_ordinals.clear()
+        self._date_keys.clear()
+        self._date_incomes.clear()
+        self._date_removed.clear()
+        self._dates_dirty = False
+    
+    def _sort_dates(self) -> None:
+        """Упорядочить индекс по дате и убрать из него удаленные доходы"""
+        if not self._dates_dirty:
+            return
+        ordinals, keys, incomes = self._date_ordinals, self._date_keys, self._date_incomes
+        removed = self._date_removed
+        positions: Iterable[int] = range(len(keys))
+        if removed:
+            positions = [pos for pos in positions if keys[pos] not in removed]
+        # Устойчивая сортировка: доходы одного дня остаются в порядке добавления
+        order = sorted(positions, key=ordinals.__getitem__)
+        self._date_ordinals = [ordinals[pos] for pos in order]
+        self._date_keys = [keys[pos] for pos in order]
+        self._date_incomes = [incomes[pos] for pos in order]
+        removed.clear()
+        self._dates_dirty = False
+    
+    def _date_range(self, start: Union[str, date, None], end: Union[str, date, None]) -> Tuple[int, int]:
+        self._sort_dates()
+        low = 0 if start is None else bisect_left(self._date_ordinals, _to_ordinal(start))
+        high = (len(self._date_ordinals) if end is None
+                else bisect_right(self._date_ordinals, _to_ordinal(end)))
+        return low, high
+    
+    def get_incomes_between(self, start: Union[str, date, None] = None,
+                            end: Union[str, date, None] = None) -> List[Income]:
+        """Доходы с датой в интервале [start, end] в порядке дат, O(log n + k);
+        после добавлений и удалений индекс сначала один раз досортировывается"""
+        low, high = self._date_range(start, end)
+        return self._date_incomes[low:high]
+    
+    def get_tax_between(self, start: Union[str, date, None] = None,
+                        end: Union[str, date, None] = None) -> float:
+        """Налог по доходам с датой в интервале [start, end]"""
+        return math.fsum(income.calculate_tax() for income in self.get_incomes_between(start, end))
+    
+    def get_period_report(self, period: str = 'month', start: Union[str, date, None] = None,
+                          end: Union[str, date, None] = None) -> List[PeriodTotals]:
+        """Доход и налог по месяцам ('month'), кварталам ('quarter') или
+        годам ('year') за один проход по индексу дат"""
+        low, high = self._date_range(start, end)
+        report: List[PeriodTotals] = []
+        period_end = -1
+        label, first_day = "", None
+        amounts: List[float] = []
+        taxes: List[float] = []
+        
+        def flush() -> None:
+            if amounts:
+                report.append(PeriodTotals(label, first_day, date.fromordinal(period_end - 1),
+                                           len(amounts), math.fsum(amounts), math.fsum(taxes)))
+        
+        for pos in range(low, high):
+            ordinal = self._date_ordinals[pos]
+            if ordinal >= period_end:
+                flush()
+                label, first_day, next_start = _period_bounds(ordinal, period)
+                period_end = next_start.toordinal()
+                amounts, taxes = [], []
+            income = self._date_incomes[pos]
+            amounts.append(income.amount)
+            taxes.append(income.calculate_tax())
+        flush()
+        return report
+    
+    def iter_keyed(self) -> Iterator[Tuple[int, Income]]:
+        """Доходы вместе с их постоянными ключами в порядке добавления"""
+        return zip(self._keys, self._incomes)
+    
+    def get_aggregates(self) -> IncomeAggregates:
+        """Текущие итоги по типам без пересчета"""
+        self._grow_types()
+        return IncomeAggregates(
+            counts=[len(bucket) for bucket in self._buckets],
+            income_by_type=[running_sum.value for running_sum in self._income_sums],
+            tax_by_type=[running_sum.value for running_sum in self._tax_sums],
+            total_income=self._total_income.value,
+            total_tax=self._total_tax.value
+        )
     
     def to_dict(self) -> Dict:
         return {
@@ -220,21 +615,20 @@ class TaxCalculator(Serializable):
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'TaxCalculator':
-        calculator = cls()
-        for income_data in data['incomes']:
-            income_type = IncomeType(income_data['income_type'])
-            
-            if income_type in [IncomeType.MAIN_JOB, IncomeType.ADDITIONAL_JOB]:
-                income = EmploymentIncome.from_dict(income_data)
-            elif income_type == IncomeType.AUTHOR_FEES:
-                income = AuthorIncome.from_dict(income_data)
-            elif income_type == IncomeType.PROPERTY_SALES:
-                income = PropertySaleIncome.from_dict(income_data)
-            else:
-                income = Income.from_dict(income_data)
-            
-            calculator.add_income(income)
+        return cls.from_records(data['incomes'])
+    
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> 'TaxCalculator':
+        """Создать калькулятор из потока записей to_dict() доходов"""
+        factories = INCOME_FACTORIES
         
+        def incomes() -> Iterator[Income]:
+            for record in records:
+                factory = factories.get(record['income_type'])
+                yield factory(record) if factory is not None else income_from_dict(record)
+        
+        calculator = cls()
+        calculator.add_incomes(incomes())
         return calculator
     
     def __str__(self) -> str:
@@ -245,35 +639,182 @@ class TaxCalculator(Serializable):
         result.append("НАЛОГОВАЯ ДЕКЛАРАЦИЯ")
         result.append("=" * 50)
         
-        # Доходы по типам
-        for income_type in IncomeType:
-            incomes = self.get_income_by_type(income_type)
-            if incomes:
-                total_income = sum(income.amount for income in incomes)
-                total_tax = sum(income.calculate_tax() for income in incomes)
+        # Доходы по типам (по текущим итогам, без повторного прохода)
+        totals = self.get_aggregates()
+        for code, income_type in enumerate(INCOME_TYPES):
+            if totals.counts[code]:
                 result.append(f"\n{income_type.value}:")
-                result.append(f"  Общий доход: {total_income:,.2f} руб.")
-                result.append(f"  Налог: {total_tax:,.2f} руб.")
+                result.append(f"  Общий доход: {totals.income_by_type[code]:,.2f} руб.")
+                result.append(f"  Налог: {totals.tax_by_type[code]:,.2f} руб.")
         
         # Итоги
         result.append("\n" + "=" * 50)
-        result.append(f"ОБЩИЙ ДОХОД: {self.get_total_income():,.2f} руб.")
-        result.append(f"ОБЩАЯ СУММА НАЛОГА: {self.get_total_tax():,.2f} руб.")
+        result.append(f"ОБЩИЙ ДОХОД: {totals.total_income:,.2f} руб.")
+        result.append(f"ОБЩАЯ СУММА НАЛОГА: {totals.total_tax:,.2f} руб.")
         result.append("=" * 50)
         
         return "\n".join(result)
 
 # ==================== FILE MANAGER ====================
 
+def _write_atomically(filename: str, lines: Iterator[str]) -> None:
+    """Записать файл через временный файл и os.replace"""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+class IncomeJournal:
+    """Журнал доходов в формате JSON Lines с дозаписью изменений.
+    
+    Каждая строка - операция {"op": "add", "id": n, "income": {...}} или
+    {"op": "remove", "id": n}. Сохраняются только новые и удаленные доходы,
+    загрузка идет потоково, а когда удаленных записей становится больше,
+    чем compact_ratio * живых, журнал переписывается атомарно.
+    """
+    
+    def __init__(self, filename: str, compact_ratio: float = 1.0):
+        self.filename = filename
+        self.compact_ratio = compact_ratio
+        self._calculator_ref: Optional[weakref.ref] = None
+        self._saved: Dict[int, int] = {}  # ключ дохода -> id записи в журнале
+        self._next_id = 0
+        self._dead = 0  # записи, утратившие смысл после удалений
+        self._torn_tail = False  # последняя строка оборвана - дописывать нельзя
+    
+    def _is_tracking(self, calculator: TaxCalculator) -> bool:
+        return self._calculator_ref is not None and self._calculator_ref() is calculator
+    
+    def save(self, calculator: TaxCalculator) -> None:
+        """Дописать изменения с момента последнего сохранения"""
+        if (self._torn_tail or not self._is_tracking(calculator)
+                or not os.path.exists(self.filename)):
+            self.compact(calculator)
+            return
+        
+        current = dict(calculator.iter_keyed())
+        removed = [key for key in self._saved if key not in current]
+        added = [key for key in current if key not in self._saved]
+        if not removed and not added:
+            return
+        
+        lines = []
+        for key in removed:
+            lines.append(self._dumps({'op': 'remove', 'id': self._saved.pop(key)}))
+        for key in added:
+            record_id = self._next_id
+            self._next_id += 1
+            self._saved[key] = record_id
+            lines.append(self._dumps({'op': 'add', 'id': record_id,
+                                      'income': current[key].to_dict()}))
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        self._dead += 2 * len(removed)
+        if self._dead > self.compact_ratio * max(len(self._saved), 1):
+            self.compact(calculator)
+    
+    def compact(self, calculator: TaxCalculator) -> None:
+        """Переписать журнал: только текущие доходы, атомарно"""
+        saved = {}
+        
+        def lines() -> Iterator[str]:
+            for record_id, (key, income) in enumerate(calculator.iter_keyed()):
+                saved[key] = record_id
+                yield self._dumps({'op': 'add', 'id': record_id, 'income': income.to_dict()})
+        
+        _write_atomically(self.filename, lines())
+        self._saved = saved
+        self._next_id = len(saved)
+        self._dead = 0
+        self._torn_tail = False
+        self._calculator_ref = weakref.ref(calculator)
+    
+    def load(self) -> TaxCalculator:
+        """Загрузить доходы потоково (два прохода, в памяти только id)"""
+        removed = set()
+        max_id = -1
+        dead = 0
+        for record in self._iter_records():
+            max_id = max(max_id, record['id'])
+            if record['op'] == 'remove':
+                removed.add(record['id'])
+                dead += 2
+        
+        live_ids: List[int] = []
+        
+        def live_incomes() -> Iterator[Dict]:
+            for record in self._iter_records():
+                if record['op'] == 'add' and record['id'] not in removed:
+                    live_ids.append(record['id'])
+                    yield record['income']
+        
+        calculator = TaxCalculator.from_dict({'incomes': live_incomes()})
+        self._saved = {key: record_id for (key, _), record_id
+                       in zip(calculator.iter_keyed(), live_ids)}
+        self._next_id = max_id + 1
+        self._dead = dead
+        self._calculator_ref = weakref.ref(calculator)
+        return calculator
+    
+    def _iter_records(self) -> Iterator[Dict]:
+        """Записи журнала. Последняя строка, оборванная сбоем при дозаписи,
+        пропускается (следующее сохранение перепишет журнал целиком);
+        поврежденная строка в середине журнала - ошибка"""
+        self._torn_tail = False
+        damaged: Optional[Tuple[int, ValueError]] = None
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                if damaged is not None:
+                    raise ValueError(f"{self.filename}, строка {damaged[0]}: {damaged[1]}")
+                self._torn_tail = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    damaged = (number, e)
+                    continue
+                yield record
+        if damaged is not None:
+            self._torn_tail = True
+    
+    @staticmethod
+    def _dumps(record: Dict) -> str:
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+
 class FileManager:
-    """Менеджер для работы с файлами"""
+    """Менеджер для работы с файлами.
+    
+    Файлы *.jsonl ведутся как журнал IncomeJournal (дозапись изменений),
+    остальные сохраняются целиком в JSON.
+    """
+    
+    _journals: Dict[str, IncomeJournal] = {}
+    
+    @staticmethod
+    def _journal(filename: str) -> Optional[IncomeJournal]:
+        if not filename.endswith('.jsonl'):
+            return None
+        key = os.path.abspath(filename)
+        if key not in FileManager._journals:
+            FileManager._journals[key] = IncomeJournal(filename)
+        return FileManager._journals[key]
     
     @staticmethod
     def save_to_file(calculator: TaxCalculator, filename: str) -> bool:
         """Сохранить данные в файл"""
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(calculator.to_dict(), f, ensure_ascii=False, indent=2)
+            journal = FileManager._journal(filename)
+            if journal is not None:
+                journal.save(calculator)
+            else:
+                data = json.dumps(calculator.to_dict(), ensure_ascii=False, indent=2)
+                _write_atomically(filename, [data])
             return True
         except Exception as e:
             print(f"Ошибка при сохранении: {e}")
@@ -283,6 +824,9 @@ class FileManager:
     def load_from_file(filename: str) -> Optional[TaxCalculator]:
         """Загрузить данные из файла"""
         try:
+            journal = FileManager._journal(filename)
+            if journal is not None:
+                return journal.load()
             with open(filename, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             return TaxCalculator.from_dict(data)
@@ -299,7 +843,9 @@ class TaxApplication:
     
     def __init__(self):
         self.calculator = TaxCalculator()
-        self.filename = "tax_data.json"
+        self.filename = "tax_data.jsonl"
+        # Прежний формат: загружается, пока журнала еще нет
+        self.legacy_filename = "tax_data.json"
     
     def display_menu(self) -> None:
         """Отобразить меню"""
@@ -375,7 +921,10 @@ class TaxApplication:
                     if FileManager.save_to_file(self.calculator, self.filename):
                         print("Данные сохранены успешно!")
                 elif choice == 4:
-                    loaded = FileManager.load_from_file(self.filename)
+                    filename = self.filename
+                    if not os.path.exists(filename) and os.path.exists(self.legacy_filename):
+                        filename = self.legacy_filename
+                    loaded = FileManager.load_from_file(filename)
                     if loaded:
                         self.calculator = loaded
                         print("Данные загружены успешно!")
@@ -391,8 +940,109 @@ class TaxApplication:
             except ValueError:
                 print("Введите число от 1 до 6")
 
+# ==================== BATCH PROCESSING ====================
+
+TAXPAYER_FILE_EXTENSIONS = ('.json', '.jsonl')
+
+def _load_taxpayer(path: str) -> TaxCalculator:
+    """Загрузить файл в формате FileManager, пробрасывая ошибки"""
+    if path.endswith('.jsonl'):
+        return IncomeJournal(path).load()
+    with open(path, 'r', encoding='utf-8') as f:
+        return TaxCalculator.from_dict(json.load(f))
+
+def process_taxpayer_file(path: str, output_dir: str) -> Dict[str, Any]:
+    """Рассчитать и записать декларацию одного налогоплательщика.
+    Декларация называется по полному имени входного файла (p0.json.txt),
+    чтобы p0.json и p0.jsonl не писали в один и тот же файл"""
+    started = time.perf_counter()
+    filename = os.path.basename(path)
+    result: Dict[str, Any] = {'taxpayer': os.path.splitext(filename)[0], 'file': path}
+    try:
+        calculator = _load_taxpayer(path)
+        totals = calculator.get_aggregates()
+        _write_atomically(os.path.join(output_dir, f"{filename}.txt"), [str(calculator), "\n"])
+        result.update(incomes=sum(totals.counts), total_income=totals.total_income,
+                      total_tax=totals.total_tax, error=None)
+    except Exception as e:
+        result.update(incomes=0, total_income=0.0, total_tax=0.0, error=f"{type(e).__name__}: {e}")
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+class BatchProcessor:
+    """Пакетный расчет деклараций для каталога файлов налогоплательщиков.
+    
+    Файлы распределяются по пулу процессов. Каталог читается лениво, а в
+    работе одновременно не больше max_pending файлов, поэтому память не
+    растет с числом налогоплательщиков.
+    """
+    
+    def __init__(self, input_dir: str, output_dir: str, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+    
+    def iter_files(self) -> Iterator[str]:
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(TAXPAYER_FILE_EXTENSIONS):
+                    yield entry.path
+    
+    def run(self) -> Dict[str, Any]:
+        """Обработать все файлы и записать summary.json в output_dir"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        started = time.perf_counter()
+        results: List[Dict[str, Any]] = []
+        
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending: Set[Future] = set()
+            for path in self.iter_files():
+                if len(pending) >= self.max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                pending.add(pool.submit(process_taxpayer_file, path, self.output_dir))
+            results.extend(future.result() for future in wait(pending).done)
+        
+        results.sort(key=itemgetter('taxpayer', 'file'))
+        processed = [result for result in results if result['error'] is None]
+        summary = {
+            'taxpayers': len(results),
+            'processed': len(processed),
+            'failed': len(results) - len(processed),
+            'total_income': math.fsum(result['total_income'] for result in processed),
+            'total_tax': math.fsum(result['total_tax'] for result in processed),
+            'workers': self.workers,
+            'seconds': time.perf_counter() - started,
+            'results': results
+        }
+        _write_atomically(os.path.join(self.output_dir, 'summary.json'),
+                          [json.dumps(summary, ensure_ascii=False, indent=2)])
+        return summary
+
 # ==================== MAIN ====================
 
-if __name__ == "__main__":
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Налоговый калькулятор")
+    parser.add_argument("--batch", metavar="DIR",
+                        help="рассчитать декларации для всех файлов каталога")
+    parser.add_argument("--output", metavar="DIR", default="declarations",
+                        help="каталог для деклараций и summary.json")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов (по умолчанию - число ядер)")
+    args = parser.parse_args()
+    
+    if args.batch:
+        summary = BatchProcessor(args.batch, args.output, args.workers).run()
+        print(f"Обработано: {summary['processed']} из {summary['taxpayers']} "
+              f"(ошибок: {summary['failed']}) за {summary['seconds']:.2f} с")
+        print(f"ОБЩИЙ ДОХОД: {summary['total_income']:,.2f} руб.")
+        print(f"ОБЩАЯ СУММА НАЛОГА: {summary['total_tax']:,.2f} руб.")
+        return
+    
     app = TaxApplication()
-    app.run()
\ No newline at end of file
+    app.run()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
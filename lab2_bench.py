@@ -0,0 +1,86 @@
+"""Замер разбора сохраненной декларации (lab2).
+
+Сравнивает прежний разбор TaxCalculator.from_dict - IncomeType(...) и
+цепочка if/elif на каждую запись - с разбором через реестр классов
+дохода (INCOME_FACTORIES). Оба варианта добавляют доходы одной пачкой
+через add_incomes, так что разница - только в поиске класса дохода.
+
+Пример:
+    python lab2_bench.py --count 1000000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, Iterator, List
+
+from lab2 import (AuthorIncome, EmploymentIncome, FileManager, INCOME_TYPES, Income, IncomeType,
+                  PropertySaleIncome, TaxCalculator)
+
+def legacy_from_dict(data: Dict) -> TaxCalculator:
+    """Прежний разбор: IncomeType(...) и цепочка if/elif на каждую запись"""
+    def incomes() -> Iterator[Income]:
+        for income_data in data['incomes']:
+            income_type = IncomeType(income_data['income_type'])
+
+            if income_type in [IncomeType.MAIN_JOB, IncomeType.ADDITIONAL_JOB]:
+                yield EmploymentIncome.from_dict(income_data)
+            elif income_type == IncomeType.AUTHOR_FEES:
+                yield AuthorIncome.from_dict(income_data)
+            elif income_type == IncomeType.PROPERTY_SALES:
+                yield PropertySaleIncome.from_dict(income_data)
+            else:
+                yield Income.from_dict(income_data)
+
+    calculator = TaxCalculator()
+    calculator.add_incomes(incomes())
+    return calculator
+
+def sample_income(rng: random.Random) -> Income:
+    income_type = rng.choice(INCOME_TYPES)
+    amount = round(rng.uniform(1000, 6000000), 2)
+    date = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if income_type in [IncomeType.MAIN_JOB, IncomeType.ADDITIONAL_JOB]:
+        return EmploymentIncome(amount, "ООО Ромашка", date, income_type == IncomeType.MAIN_JOB)
+    if income_type == IncomeType.AUTHOR_FEES:
+        return AuthorIncome(amount, "Сборник рассказов", date)
+    if income_type == IncomeType.PROPERTY_SALES:
+        return PropertySaleIncome(amount, "квартиры", date)
+    return Income(amount, "Перевод", date, income_type)
+
+def benchmark_deserialization(count: int = 1000000, filename: str = "bench_incomes.json") -> Dict[str, float]:
+    """Сравнить прежний разбор TaxCalculator.from_dict с реестром типов"""
+    if not os.path.exists(filename):
+        rng = random.Random(42)
+        calculator = TaxCalculator()
+        calculator.add_incomes(sample_income(rng) for _ in range(count))
+        FileManager.save_to_file(calculator, filename)
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    results: Dict[str, float] = {}
+    totals: List[float] = []
+    for name, load in (('legacy', legacy_from_dict), ('registry', TaxCalculator.from_dict)):
+        started = time.perf_counter()
+        calculator = load(data)
+        results[name] = time.perf_counter() - started
+        totals.append(calculator.get_total_tax())
+        print(f"{name:>8}: {results[name]:.3f} с "
+              f"({len(data['incomes']) / results[name]:,.0f} записей/с)")
+    if totals[0] != totals[1]:
+        print(f"Итоги налога различаются: {totals[0]:,.2f} и {totals[1]:,.2f}")
+    print(f"Ускорение: {results['legacy'] / results['registry']:.2f}x")
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замер разбора декларации (lab2)")
+    parser.add_argument("--count", type=int, default=1000000, help="записей в тестовом файле")
+    parser.add_argument("--file", default=None,
+                        help="файл с записями (по умолчанию bench_incomes_<count>.json, создается при отсутствии)")
+    args = parser.parse_args()
+    benchmark_deserialization(args.count, args.file or f"bench_incomes_{args.count}.json")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
+import queue
+import random
 import socket
+import threading
 import tkinter as tk
+from datetime import datetime
 from tkinter import scrolledtext
-import threading
+
+from protocol import ProtocolError, SequenceTracker, decode_record, recv_frame
+
+RECONNECT_MIN = 0.5  # первая пауза перед переподключением, с
+RECONNECT_MAX = 30.0
+READ_TIMEOUT = 45.0  # промежуточный клиент шлет пустой кадр раз в 15 с
+POLL_INTERVAL = 100  # период разбора очереди событий в окне, мс
 
 class FinalClient:
     def __init__(self, host='localhost', port=1503):
@@ -10,39 +20,93 @@ class FinalClient:
         self.root = tk.Tk()
         self.root.title("Погода")
         self.root.geometry("500x300")
-        
+
         # Кнопки
         self.connect_btn = tk.Button(self.root, text="Подключиться", command=self.connect)
         self.connect_btn.pack(pady=10)
-        
+
         # Статус
         self.status = tk.Label(self.root, text="Не подключено", fg="red")
         self.status.pack()
-        
+
         # Сообщения
         self.text_area = scrolledtext.ScrolledText(self.root, height=15)
         self.text_area.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         self.text_area.insert(tk.END, "Нажмите 'Подключиться'")
-    
+
+        # Поток подписки не трогает виджеты: события идут через очередь
+        self.events = queue.Queue()
+        self.stopped = threading.Event()
+        self.worker = None
+        self.trackers = {}  # канал -> SequenceTracker (повторы после переподключения)
+        self.has_messages = False
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after(POLL_INTERVAL, self.poll_events)
+
     def connect(self):
-        def thread():
+        if self.worker is None or not self.worker.is_alive():
+            self.connect_btn.config(state=tk.DISABLED)
+            self.worker = threading.Thread(target=self.subscribe, daemon=True)
+            self.worker.start()
+
+    def subscribe(self):
+        """Держать подписку; при обрыве переподключаться с растущей паузой.
+        После переподключения запрашивается только пропущенное (SINCE)"""
+        delay = RECONNECT_MIN
+        since = None  # время самого нового полученного сообщения, мкс
+        while not self.stopped.is_set():
+            self.events.put(('status', "Подключение...", "orange"))
             try:
-                self.status.config(text="Подключение...", fg="orange")
-                client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                client_socket.connect((self.host, self.port))
-                data = client_socket.recv(4096).decode('utf-8')
-                client_socket.close()
-                
-                self.text_area.delete(1.0, tk.END)
-                self.text_area.insert(tk.END, data)
-                self.status.config(text="Успешно подключено", fg="green")
-            except:
-                self.status.config(text="Ошибка подключения", fg="red")
-        
-        threading.Thread(target=thread, daemon=True).start()
-    
+                with socket.create_connection((self.host, self.port), timeout=READ_TIMEOUT) as sock:
+                    sock.sendall(b"SUBSCRIBE\n" if since is None else f"SUBSCRIBE SINCE {since}\n".encode())
+                    self.events.put(('status', "Подписка активна", "green"))
+                    while not self.stopped.is_set():
+                        data = recv_frame(sock)
+                        if data is None:
+                            break
+                        delay = RECONNECT_MIN
+                        if data:  # пустой кадр - проверка связи
+                            message = decode_record(data)
+                            since = message.timestamp if since is None else max(since, message.timestamp)
+                            self.events.put(('message', message))
+            except (OSError, ProtocolError):
+                pass
+            if self.stopped.is_set():
+                break
+            self.events.put(('status', f"Нет связи, повтор через {delay:.1f} с", "red"))
+            self.stopped.wait(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    def poll_events(self):
+        try:
+            while True:
+                kind, *args = self.events.get_nowait()
+                if kind == 'status':
+                    self.status.config(text=args[0], fg=args[1])
+                else:
+                    self.show_message(args[0])
+        except queue.Empty:
+            pass
+        if not self.stopped.is_set():
+            self.root.after(POLL_INTERVAL, self.poll_events)
+
+    def show_message(self, message):
+        tracker = self.trackers.setdefault(message.channel, SequenceTracker())
+        if not tracker.accept(message.session, message.seq):
+            return
+        if not self.has_messages:
+            self.text_area.delete(1.0, tk.END)
+            self.has_messages = True
+        sent = datetime.fromtimestamp(message.timestamp / 1e6).strftime('%H:%M:%S')
+        self.text_area.insert(tk.END, f"[{sent}] {message.payload.decode('utf-8')}\n")
+        self.text_area.see(tk.END)
+
+    def close(self):
+        self.stopped.set()
+        self.root.destroy()
+
     def start(self):
         self.root.mainloop()
 
 if __name__ == "__main__":
-    FinalClient().start()
\ No newline at end of file
+    FinalClient().start()
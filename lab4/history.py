@@ -0,0 +1,217 @@
+"""История сообщений промежуточного клиента.
+
+MemoryHistory держит последние сообщения в памяти, MmapHistory - в файле:
+кольцевом буфере фиксированного размера, отображенном в память (mmap).
+Оба варианта индексируют сообщения по номеру (канал, сессия, номер) и по
+времени отправки, так что клиенту можно отдать только недостающее:
+последние N или начиная с момента X.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import deque
+import mmap
+import os
+import struct
+import zlib
+
+from protocol import ProtocolError, decode_record, message_frame
+
+class MessageHistory(ABC):
+    """Хранилище сообщений с индексом по номеру и по времени.
+    Вытесняются самые давние по порядку добавления"""
+
+    def __init__(self):
+        self._order = []  # (время, канал, номер, сессия) по возрастанию времени
+        self._refs = {}  # (канал, сессия, номер) -> место сообщения в хранилище
+        self._fifo = deque()  # (место, ключ из _order) в порядке добавления
+
+    @abstractmethod
+    def _store(self, message):
+        """Сохранить сообщение и вернуть его место для _load"""
+
+    @abstractmethod
+    def _load(self, ref):
+        """Сообщение по месту хранения"""
+
+    def _index(self, message, ref):
+        entry = (message.timestamp, message.channel, message.seq, message.session)
+        insort(self._order, entry)
+        self._refs[(message.channel, message.session, message.seq)] = ref
+        self._fifo.append((ref, entry))
+
+    def _evict_oldest(self):
+        ref, entry = self._fifo.popleft()
+        del self._order[bisect_left(self._order, entry)]
+        timestamp, channel, seq, session = entry
+        del self._refs[(channel, session, seq)]
+        return ref
+
+    def append(self, message):
+        """Добавить сообщение; False - оно уже есть"""
+        if (message.channel, message.session, message.seq) in self._refs:
+            return False
+        self._index(message, self._store(message))
+        return True
+
+    def get(self, channel, session, seq):
+        ref = self._refs.get((channel, session, seq))
+        return None if ref is None else self._load(ref)
+
+    def _messages(self, entries):
+        return [self._load(self._refs[(channel, session, seq)]) for _, channel, seq, session in entries]
+
+    def since(self, timestamp):
+        """Сообщения, отправленные не раньше timestamp (мкс), по времени"""
+        return self._messages(self._order[bisect_left(self._order, (timestamp,)):])
+
+    def last(self, count):
+        """Последние count сообщений по времени"""
+        return self._messages(self._order[-count:]) if count > 0 else []
+
+    def __len__(self):
+        return len(self._order)
+
+    def close(self):
+        pass
+
+class MemoryHistory(MessageHistory):
+    """Последние capacity сообщений в памяти (теряются при перезапуске)"""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.capacity = capacity
+
+    def _store(self, message):
+        if len(self._fifo) >= self.capacity:
+            self._evict_oldest()
+        return message
+
+    def _load(self, ref):
+        return ref
+
+# Файл MmapHistory: заголовок, затем кольцевая область записей длиной capacity байт
+FILE_HEADER = struct.Struct('!8sQQQ')  # сигнатура, capacity, смещение и номер самой давней записи
+RECORD = struct.Struct('!IIQ')  # длина кадра, crc32 кадра, номер записи
+MAGIC = b'WXHIST01'
+WRAP = 0xFFFFFFFF  # длина-маркер: следующая запись - в начале области
+
+class MmapHistory(MessageHistory):
+    """Кольцевой буфер записей в файле, отображенном в память.
+
+    Запись - RECORD + кадр сообщения (protocol.message_frame). Записи идут
+    подряд; не помещающаяся до конца области начинается с ее начала (на
+    старом месте - маркер WRAP). Новым записям место освобождается
+    вытеснением самых давних. Номера записей растут на 1, поэтому при
+    открытии хвост кольца читается от самой давней записи, пока номера идут
+    подряд и совпадают crc: старые данные прошлых кругов и запись,
+    оборванная сбоем, отсекаются без отдельного журнала.
+
+    Данные попадают в страничный кэш сразу - падение процесса их не теряет;
+    flush() сбрасывает их на диск на случай сбоя всей системы.
+    Если файл уже есть, его capacity важнее переданной"""
+
+    def __init__(self, path, capacity=1024 * 1024):
+        super().__init__()
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= FILE_HEADER.size
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, capacity, _, _ = FILE_HEADER.unpack(self._file.read(FILE_HEADER.size))
+            if magic != MAGIC:
+                self._file.close()
+                raise ValueError(f'{path}: не файл истории сообщений')
+        else:
+            self._file.write(FILE_HEADER.pack(MAGIC, capacity, 0, 1))
+            self._file.truncate(FILE_HEADER.size + capacity)
+        self.capacity = capacity
+        self._mm = mmap.mmap(self._file.fileno(), FILE_HEADER.size + capacity)
+        self._recover()
+
+    def _read_record(self, offset):
+        return RECORD.unpack_from(self._mm, FILE_HEADER.size + offset)
+
+    def _recover(self):
+        """Восстановить индекс: пройти записи от самой давней"""
+        _, _, offset, no = FILE_HEADER.unpack_from(self._mm)
+        scanned = 0
+        while scanned < self.capacity:
+            if self.capacity - offset < RECORD.size:
+                scanned += self.capacity - offset
+                offset = 0
+                continue
+            length, crc, record_no = self._read_record(offset)
+            if record_no != no:
+                break
+            if length == WRAP:
+                scanned += self.capacity - offset
+                offset = 0
+                continue
+            start = FILE_HEADER.size + offset + RECORD.size
+            if length > self.capacity - offset - RECORD.size or zlib.crc32(self._mm[start:start + length]) != crc:
+                break
+            try:
+                message = decode_record(self._mm[start:start + length])
+            except ProtocolError:
+                break
+            self._index(message, offset)
+            offset += RECORD.size + length
+            scanned += RECORD.size + length
+            no += 1
+        self._head = offset
+        self._next_no = no
+
+    def _used(self):
+        if not self._fifo:
+            return 0
+        return (self._head - self._fifo[0][0]) % self.capacity
+
+    def _store(self, message):
+        frame = message_frame(message)
+        size = RECORD.size + len(frame)
+        if size + RECORD.size >= self.capacity:
+            raise ValueError(f'Сообщение длиной {len(frame)} байт не помещается в историю')
+        if not self._fifo:
+            self._head = 0
+        start = self._head if self.capacity - self._head >= size else 0
+        # Переход в начало занимает и остаток области до конца
+        needed = size if start == self._head else self.capacity - self._head + size
+        while self._fifo and needed >= self.capacity - self._used():
+            self._evict_oldest()
+        if not self._fifo:
+            start, needed = 0, size
+            self._head = 0
+        # Сначала заголовок (самая давняя запись), затем сама запись
+        self._write_tail(start)
+        if start != self._head and self.capacity - self._head >= RECORD.size:
+            RECORD.pack_into(self._mm, FILE_HEADER.size + self._head, WRAP, 0, self._next_no)
+        RECORD.pack_into(self._mm, FILE_HEADER.size + start, len(frame), zlib.crc32(frame), self._next_no)
+        self._mm[FILE_HEADER.size + start + RECORD.size:FILE_HEADER.size + start + size] = frame
+        self._head = start + size
+        self._next_no += 1
+        return start
+
+    def _write_tail(self, start):
+        # Номера записей идут подряд: у самой давней - next_no минус их число
+        if self._fifo:
+            tail, tail_no = self._fifo[0][0], self._next_no - len(self._fifo)
+        else:
+            tail, tail_no = start, self._next_no
+        FILE_HEADER.pack_into(self._mm, 0, MAGIC, self.capacity, tail, tail_no)
+
+    def _load(self, ref):
+        length, _, _ = self._read_record(ref)
+        start = FILE_HEADER.size + ref + RECORD.size
+        return decode_record(self._mm[start:start + length])
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+def open_history(spec, capacity=1024 * 1024):
+    """'memory' - история в памяти, иначе путь к файлу MmapHistory"""
+    if spec == 'memory':
+        return MemoryHistory()
+    return MmapHistory(spec, capacity)
@@ -1,47 +1,287 @@
+import argparse
+import asyncio
+import multiprocessing
 import socket
-import threading
-from collections import deque
+import time
+
+from history import MemoryHistory, open_history
+from protocol import (HEARTBEAT, Message, ProtocolError, Reassembler, SequenceTracker,
+                      decode_frame, decode_record, encode_record, new_session, now_us,
+                      pack_frame, read_frame)
+
+CATCHUP_DELAY = 0.05  # ждем опоздавшие датаграммы, прежде чем просить сервер
+CATCHUP_BATCH = 256  # номеров в одном запросе догрузки
+REQUEST_WAIT = 0.5  # старые клиенты ничего не шлют: после паузы отдаем им сводку текстом
+KEEPALIVE_INTERVAL = 15.0  # пустой кадр подписчикам, чтобы они замечали обрыв
+SUBSCRIBER_BUFFER = 1024 * 1024  # неотправленных байт, после которых подписчик отключается
+RECENT_COUNT = 5  # сообщений в ответе по умолчанию
+
+class MulticastProtocol(asyncio.DatagramProtocol):
+    """Прием сводок из multicast-группы в цикле событий"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client.on_datagram(data, addr)
 
 class IntermediateClient:
-    def __init__(self, udp_group='233.0.0.1', udp_port=1502, tcp_port=1503):
-        self.last_messages = deque(maxlen=5)
+    """Принимает сводки по UDP multicast и отдает последние из них TCP-клиентам.
+    Все в одном цикле asyncio: без потока на соединение и без общих
+    данных между потоками.
+
+    Запрос TCP-клиента - одна строка:
+      LAST <n> - последние n сообщений из истории, кадрами с префиксом длины
+                 (protocol.py), затем закрытие;
+      SINCE <время, мкс> - сообщения, отправленные не раньше указанного времени;
+      SUBSCRIBE [LAST <n> | SINCE <время>] - то же (по умолчанию последние
+                 RECENT_COUNT), затем соединение остается открытым и каждое
+                 новое сообщение приходит таким же кадром;
+      GET (или ничего в течение REQUEST_WAIT) - последние сообщения текстом,
+                 затем закрытие, как раньше"""
+
+    def __init__(self, udp_group='233.0.0.1', udp_port=1502, tcp_port=1503,
+                 max_connections=10000, timeout=5.0, catchup_port=1504, history=None):
+        # История с индексом по номеру и времени (history.py)
+        self.history = MemoryHistory() if history is None else history
         self.current_message = ""
-        
+        # Готовый ответ TCP-клиентам, пересобирается только при новом сообщении
+        self.response = "Нет сообщений".encode('utf-8')
+        self.refresh_response()
+        self.tcp_port = tcp_port
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.connections = 0
+        self.rejected = 0
+        # Номера по каналам: повторы отсеиваются, пропуски догружаются с сервера по TCP
+        self.catchup_port = catchup_port
+        self.reassembler = Reassembler()
+        self.trackers = {}
+        self.catching_up = set()
+        self.subscribers = set()  # StreamWriter подписчиков
+
         # UDP
         self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.udp_sock.bind(('', udp_port))
         mreq = socket.inet_aton(udp_group) + socket.inet_aton('0.0.0.0')
         self.udp_sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        
-        # TCP
-        self.tcp_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.tcp_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.tcp_server.bind(('localhost', tcp_port))
-        self.tcp_server.listen(5)
-    
-    def receive_udp(self):
+        self.udp_sock.setblocking(False)
+
+    def on_datagram(self, data, addr):
+        try:
+            frame = decode_frame(data)
+        except ProtocolError as e:
+            print(f"Пропущена датаграмма от {addr[0]}: {e}")
+            return
+        tracker = self.trackers.setdefault(frame.channel, SequenceTracker())
+        if frame.kind == HEARTBEAT:
+            tracker.observe(frame.session, frame.seq)
+        else:
+            message = self.reassembler.add(frame)
+            if message is not None and tracker.accept(message.session, message.seq):
+                self.on_message(message)
+        if tracker.missing and self.catchup_port and frame.channel not in self.catching_up:
+            self.catching_up.add(frame.channel)
+            asyncio.get_running_loop().create_task(self.catch_up(addr[0], frame.channel))
+
+    async def catch_up(self, host, channel):
+        """Запросить у сервера пропущенные сообщения канала"""
+        tracker = self.trackers[channel]
+        missing = []
+        try:
+            await asyncio.sleep(CATCHUP_DELAY)
+            session = tracker.session
+            missing = sorted(tracker.missing)[-CATCHUP_BATCH:]
+            if not missing:
+                return
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, self.catchup_port), self.timeout)
+            try:
+                writer.write(f"RESEND {channel} {' '.join(map(str, missing))}\n".encode('utf-8'))
+                while (data := await asyncio.wait_for(read_frame(reader), self.timeout)) is not None:
+                    message = decode_record(data)
+                    if message.session == session and tracker.accept(message.session, message.seq):
+                        self.on_message(message)
+            finally:
+                writer.close()
+            print(f"Догружено по TCP: канал {channel}, запрошено {len(missing)}")
+        except (OSError, asyncio.TimeoutError, ProtocolError) as e:
+            print(f"Ошибка догрузки канала {channel}: {e}")
+        finally:
+            # Чего нет у сервера, больше не ждем
+            if missing and tracker.session == session:
+                tracker.missing.difference_update(missing)
+            self.catching_up.discard(channel)
+
+    def on_message(self, message):
+        # Уже сохраненное (например, до перезапуска) не рассылается повторно
+        if not self.history.append(message):
+            return
+        self.refresh_response()
+        print(f"Новое сообщение #{message.seq}: {message.payload.decode('utf-8')}")
+        self.push(encode_record(message))
+
+    def refresh_response(self):
+        recent = self.history.last(RECENT_COUNT)
+        if recent:
+            self.current_message = recent[-1].payload.decode('utf-8')
+            self.response = b"\n".join(message.payload for message in recent)
+
+    def query(self, words):
+        """Сообщения по запросу LAST <n> / SINCE <время>; None - запрос неверен"""
+        if not words:
+            return self.history.last(RECENT_COUNT)
+        if len(words) != 2 or not words[1].isdigit():
+            return None
+        if words[0] == 'LAST':
+            return self.history.last(int(words[1]))
+        if words[0] == 'SINCE':
+            return self.history.since(int(words[1]))
+        return None
+
+    def push(self, frame):
+        """Отправить кадр всем подписчикам"""
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > SUBSCRIBER_BUFFER:
+                # Подписчик не успевает читать - отключаем, он переподключится
+                self.subscribers.discard(writer)
+                writer.transport.abort()
+            else:
+                writer.write(frame)
+
+    async def read_request(self, reader):
+        try:
+            line = await asyncio.wait_for(reader.readline(), REQUEST_WAIT)
+        except (asyncio.TimeoutError, ValueError):
+            return []
+        return line.decode('utf-8', 'replace').split()
+
+    async def subscribe(self, reader, writer, messages):
+        """Отдать messages, затем держать соединение и пересылать новые сообщения"""
+        writer.write(b''.join(map(encode_record, messages)))
+        self.subscribers.add(writer)
+        try:
+            await asyncio.wait_for(writer.drain(), self.timeout)
+            # Подписчик больше ничего не шлет - ждем, пока он закроет соединение
+            while await reader.read(1024):
+                pass
+        finally:
+            self.subscribers.discard(writer)
+
+    async def keepalive(self):
         while True:
-            data, _ = self.udp_sock.recvfrom(1024)
-            message = data.decode('utf-8')
-            if message != self.current_message:
-                self.current_message = message
-                self.last_messages.append(message)
-                print(f"Новое сообщение: {message}")
-    
-    def handle_tcp(self, client_socket):
-        messages = "\n".join(self.last_messages) if self.last_messages else "Нет сообщений"
-        client_socket.send(messages.encode('utf-8'))
-        client_socket.close()
-    
-    def start(self):
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            self.push(pack_frame(b''))
+
+    async def handle_tcp(self, reader, writer):
+        # Сверх лимита соединение сразу закрывается без ответа
+        if self.connections >= self.max_connections:
+            self.rejected += 1
+            writer.transport.abort()
+            return
+        self.connections += 1
+        try:
+            request = await self.read_request(reader)
+            if request[:1] == ['SUBSCRIBE']:
+                messages = self.query(request[1:])
+                if messages is not None:
+                    await self.subscribe(reader, writer, messages)
+            elif request[:1] in (['LAST'], ['SINCE']):
+                messages = self.query(request)
+                if messages:
+                    writer.write(b''.join(map(encode_record, messages)))
+                    await asyncio.wait_for(writer.drain(), self.timeout)
+            else:
+                writer.write(self.response)
+                # Медленный клиент не держит соединение дольше timeout
+                await asyncio.wait_for(writer.drain(), self.timeout)
+            writer.close()
+        except (asyncio.TimeoutError, ConnectionError):
+            writer.transport.abort()
+        finally:
+            self.connections -= 1
+
+    async def serve(self, started=None):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: MulticastProtocol(self), sock=self.udp_sock)
+        server = await asyncio.start_server(self.handle_tcp, 'localhost', self.tcp_port,
+                                            reuse_address=True, backlog=4096)
+        keepalive = asyncio.create_task(self.keepalive())
         print("Промежуточный клиент запущен")
-        threading.Thread(target=self.receive_udp, daemon=True).start()
-        
-        while True:
-            client_socket, addr = self.tcp_server.accept()
-            print(f"Клиент подключен: {addr}")
-            threading.Thread(target=self.handle_tcp, args=(client_socket,), daemon=True).start()
+        if started is not None:
+            started.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            keepalive.cancel()
+            transport.close()
+            # Подписчики узнают об остановке сразу, а не по таймауту
+            for writer in list(self.subscribers):
+                writer.transport.abort()
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.history.close()
+
+def serve_bench(tcp_port, count, text, started):
+    client = IntermediateClient(tcp_port=tcp_port, max_connections=count, catchup_port=0)
+    client.on_message(Message(0, new_session(), 1, now_us(), text.encode('utf-8')))
+
+    async def main():
+        ready = asyncio.Event()
+        server = asyncio.create_task(client.serve(ready))
+        await ready.wait()
+        started.set()
+        await server
+
+    asyncio.run(main())
+
+async def bench_clients(count, tcp_port):
+    """count одновременных TCP-клиентов; промежуточный клиент - в отдельном
+    процессе, чтобы сокеты обеих сторон не делили один лимит дескрипторов"""
+    text = "Погода для замера"
+    started = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve_bench, args=(tcp_port, count, text, started), daemon=True)
+    process.start()
+    started.wait()
+
+    async def fetch():
+        reader, writer = await asyncio.open_connection('localhost', tcp_port)
+        writer.write(b"GET\n")
+        try:
+            return await reader.read() == text.encode('utf-8')
+        finally:
+            writer.close()
+
+    begin = time.perf_counter()
+    results = await asyncio.gather(*(fetch() for _ in range(count)), return_exceptions=True)
+    seconds = time.perf_counter() - begin
+    process.terminate()
+    ok = sum(1 for result in results if result is True)
+    print(f"Клиентов: {count}, успешно {ok}, ошибок {count - ok}, "
+          f"{seconds:.2f} с ({count / seconds:,.0f} соединений/с)")
 
 if __name__ == "__main__":
-    IntermediateClient().start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Промежуточный клиент: UDP multicast -> TCP")
+    parser.add_argument('--max-connections', type=int, default=10000, help="одновременных TCP-клиентов")
+    parser.add_argument('--timeout', type=float, default=5.0, help="таймаут отправки ответа, с")
+    parser.add_argument('--catchup-port', type=int, default=1504,
+                        help="TCP-порт сервера для догрузки пропусков (0 - выключить)")
+    parser.add_argument('--history', default='history.bin',
+                        help="файл истории сообщений или memory (без сохранения)")
+    parser.add_argument('--history-bytes', type=int, default=1024 * 1024,
+                        help="размер кольцевого буфера истории нового файла, байт")
+    parser.add_argument('--bench-clients', type=int, metavar='N',
+                        help="замерить обслуживание N одновременных клиентов и выйти")
+    args = parser.parse_args()
+
+    if args.bench_clients:
+        asyncio.run(bench_clients(args.bench_clients, 1603))
+    else:
+        IntermediateClient(max_connections=args.max_connections, timeout=args.timeout,
+                           catchup_port=args.catchup_port,
+                           history=open_history(args.history, args.history_bytes)).start()
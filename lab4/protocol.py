@@ -0,0 +1,190 @@
+"""Двоичный формат сводок погоды.
+
+Датаграмма = заголовок HEADER + часть текста сообщения (UTF-8):
+версия, вид кадра (DATA/HEARTBEAT), канал (номер ленты сервера), сессия
+(случайное число при запуске сервера), номер сообщения в канале, время
+отправки (микросекунды), номер фрагмента и число фрагментов. Длинные
+сообщения режутся на фрагменты не длиннее MAX_DATAGRAM байт.
+
+Пульс (HEARTBEAT) несет номер последнего отправленного сообщения, чтобы
+получатель заметил пропуск и без новых данных. По TCP сообщения идут
+целиком (один фрагмент), каждое с префиксом длины LENGTH.
+"""
+import asyncio
+from collections import OrderedDict, namedtuple
+import os
+import struct
+import time
+
+VERSION = 1
+DATA = 0
+HEARTBEAT = 1
+
+HEADER = struct.Struct('!BBHIIqHH')  # версия, вид, канал, сессия, номер, время, фрагмент, фрагментов
+LENGTH = struct.Struct('!I')  # префикс длины кадра в TCP-потоке
+MAX_DATAGRAM = 1400  # не больше MTU Ethernet, чтобы IP не дробил датаграммы
+MAX_PAYLOAD = MAX_DATAGRAM - HEADER.size
+MAX_FRAME = 64 * 1024 * 1024  # предел длины кадра из TCP-потока
+
+class ProtocolError(ValueError):
+    """Поврежденный или чужой кадр"""
+
+Frame = namedtuple('Frame', 'kind channel session seq timestamp index count payload')
+Message = namedtuple('Message', 'channel session seq timestamp payload')
+
+def now_us():
+    return time.time_ns() // 1000
+
+def new_session():
+    return int.from_bytes(os.urandom(4), 'big')
+
+def encode_message(message):
+    """Датаграммы (фрагменты) сообщения"""
+    payload = message.payload
+    chunks = [payload[i:i + MAX_PAYLOAD] for i in range(0, len(payload), MAX_PAYLOAD)] or [b'']
+    if len(chunks) > 0xFFFF:
+        raise ProtocolError('Сообщение слишком длинное')
+    return [HEADER.pack(VERSION, DATA, message.channel, message.session, message.seq,
+                        message.timestamp, index, len(chunks)) + chunk
+            for index, chunk in enumerate(chunks)]
+
+def encode_heartbeat(channel, session, seq):
+    return HEADER.pack(VERSION, HEARTBEAT, channel, session, seq, now_us(), 0, 0)
+
+def decode_frame(data):
+    if len(data) < HEADER.size:
+        raise ProtocolError('Кадр короче заголовка')
+    version, kind, channel, session, seq, timestamp, index, count = HEADER.unpack_from(data)
+    if version != VERSION or kind not in (DATA, HEARTBEAT):
+        raise ProtocolError(f'Неизвестный кадр: версия {version}, вид {kind}')
+    if kind == DATA and index >= count:
+        raise ProtocolError(f'Фрагмент {index} из {count}')
+    return Frame(kind, channel, session, seq, timestamp, index, count, data[HEADER.size:])
+
+# Кадры в TCP-потоке: длина + данные
+def pack_frame(data):
+    return LENGTH.pack(len(data)) + data
+
+def message_frame(message):
+    """Сообщение целиком одним кадром (без префикса длины)"""
+    return HEADER.pack(VERSION, DATA, message.channel, message.session, message.seq,
+                       message.timestamp, 0, 1) + message.payload
+
+def encode_record(message):
+    """Сообщение целиком одним кадром для TCP"""
+    return pack_frame(message_frame(message))
+
+def decode_record(data):
+    frame = decode_frame(data)
+    if frame.kind != DATA or frame.count != 1:
+        raise ProtocolError('Ожидалось сообщение из одного фрагмента')
+    return Message(frame.channel, frame.session, frame.seq, frame.timestamp, frame.payload)
+
+async def read_frame(reader):
+    """Следующий кадр из asyncio.StreamReader; None - поток закрыт между кадрами"""
+    try:
+        header = await reader.readexactly(LENGTH.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError('Поток оборван внутри кадра')
+        return None
+    length, = LENGTH.unpack(header)
+    if length > MAX_FRAME:
+        raise ProtocolError(f'Кадр длиной {length} байт')
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ProtocolError('Поток оборван внутри кадра')
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return data
+        data += chunk
+    return data
+
+def recv_frame(sock):
+    """Следующий кадр из блокирующего сокета; None - соединение закрыто между кадрами"""
+    header = recv_exactly(sock, LENGTH.size)
+    if not header:
+        return None
+    if len(header) < LENGTH.size:
+        raise ProtocolError('Поток оборван внутри кадра')
+    length, = LENGTH.unpack(header)
+    if length > MAX_FRAME:
+        raise ProtocolError(f'Кадр длиной {length} байт')
+    data = recv_exactly(sock, length)
+    if len(data) < length:
+        raise ProtocolError('Поток оборван внутри кадра')
+    return data
+
+class Reassembler:
+    """Сборка сообщений из фрагментов. Незавершенных сообщений хранится
+    не больше max_pending - самые старые выбрасываются (их догрузит TCP)"""
+
+    def __init__(self, max_pending=32):
+        self.max_pending = max_pending
+        self.pending = OrderedDict()  # (канал, сессия, номер) -> {фрагмент: данные}
+
+    def add(self, frame):
+        """Готовое сообщение или None, если собраны еще не все фрагменты"""
+        if frame.count == 1:
+            return Message(frame.channel, frame.session, frame.seq, frame.timestamp, frame.payload)
+        key = (frame.channel, frame.session, frame.seq)
+        parts = self.pending.get(key)
+        if parts is None:
+            parts = self.pending[key] = {}
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+        parts[frame.index] = frame.payload
+        if len(parts) < frame.count:
+            return None
+        del self.pending[key]
+        payload = b''.join(parts[index] for index in range(frame.count))
+        return Message(frame.channel, frame.session, frame.seq, frame.timestamp, payload)
+
+class SequenceTracker:
+    """Номера сообщений одного канала: отсев повторов и учет пропусков.
+    Новая сессия (сервер перезапущен) начинает учет заново"""
+
+    def __init__(self, max_missing=1000):
+        self.max_missing = max_missing
+        self.session = None
+        self.last = 0
+        self.missing = set()
+
+    def _restart(self, session, last):
+        self.session = session
+        self.last = last
+        self.missing.clear()
+
+    def _mark_missing(self, stop):
+        # Пропущены номера от последнего до stop (помним не больше max_missing)
+        self.missing.update(range(max(self.last + 1, stop - self.max_missing), stop))
+
+    def accept(self, session, seq):
+        """True - сообщение новое (его нужно обработать), False - повтор"""
+        if session != self.session:
+            self._restart(session, seq)
+            return True
+        if seq > self.last:
+            self._mark_missing(seq)
+            self.last = seq
+            return True
+        if seq in self.missing:
+            self.missing.discard(seq)
+            return True
+        return False
+
+    def observe(self, session, seq):
+        """Пульс: у сервера последнее сообщение seq"""
+        if session != self.session:
+            # Подключились к новой сессии - запросим ее текущее сообщение
+            self._restart(session, seq)
+            if seq:
+                self.missing.add(seq)
+        elif seq > self.last:
+            self._mark_missing(seq + 1)
+            self.last = seq
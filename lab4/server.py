@@ -1,31 +1,308 @@
+import argparse
+from collections import OrderedDict
+import ctypes
+import ctypes.util
+import ipaddress
+import os
+import select
 import socket
+import socketserver
+import struct
+import tempfile
+import threading
 import time
 
+from protocol import (HEARTBEAT, Message, ProtocolError, decode_frame, encode_heartbeat,
+                      encode_message, encode_record, new_session, now_us)
+
+# События inotify (linux/inotify.h): запись закрыта или файл подменен переименованием
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (+ имя len байт)
+
+class InotifyWatcher:
+    """Изменения файлов через inotify (Linux, вызовы libc через ctypes).
+    Следим за каталогами файлов: так видна и запись на месте, и замена
+    файла переименованием (как делают редакторы)"""
+
+    def __init__(self, paths):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify недоступен')
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.watches = {}  # wd -> {имя в каталоге: путь}
+        for path in paths:
+            directory, name = os.path.split(os.path.abspath(path))
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f'inotify_add_watch: {directory}')
+            self.watches.setdefault(wd, {})[os.fsencode(name)] = path
+
+    def wait(self, timeout=None):
+        """Пути измененных файлов; пустое множество - истек timeout"""
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            path = self.watches.get(wd, {}).get(name)
+            if path is not None:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Запасной вариант без inotify: опрос os.stat (время изменения, размер,
+    inode). Запись того же размера в пределах точности mtime не видна"""
+
+    def __init__(self, paths, interval=0.05):
+        self.interval = interval
+        self.states = {path: self.state(path) for path in paths}
+
+    @staticmethod
+    def state(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def wait(self, timeout=None):
+        """Пути измененных файлов; пустое множество - истек timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, old_state in self.states.items():
+                new_state = self.state(path)
+                if new_state != old_state:
+                    self.states[path] = new_state
+                    changed.add(path)
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+def create_watcher(paths, mode='auto', poll_interval=0.05):
+    """inotify, если доступен (mode='auto'), иначе опрос stat"""
+    if mode in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(paths)
+        except OSError:
+            if mode == 'inotify':
+                raise
+    return PollingWatcher(paths, poll_interval)
+
+class Feed:
+    """Файл-источник и его канал рассылки"""
+
+    def __init__(self, channel, filename, group, port):
+        self.channel = channel  # номер канала в заголовке кадров
+        self.filename = filename
+        self.group = group
+        self.port = port
+        self.message = None  # последнее отправленное сообщение
+        self.seq = 0
+        self.sent = OrderedDict()  # номер -> Message, для догрузки по TCP
+
+class CatchupHandler(socketserver.StreamRequestHandler):
+    """TCP-запрос пропущенных сообщений: "RESEND <канал> <номер> ...\n".
+    Ответ - найденные сообщения кадрами с префиксом длины, затем закрытие"""
+
+    def handle(self):
+        words = self.rfile.readline(65536).decode('utf-8', 'replace').split()
+        if len(words) < 2 or words[0] != 'RESEND' or not all(word.isdigit() for word in words[1:]):
+            return
+        channel, *seqs = map(int, words[1:])
+        for message in self.server.udp_server.lookup(channel, seqs):
+            self.wfile.write(encode_record(message))
+
+class CatchupServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
 class UDPServer:
-    def __init__(self, group='233.0.0.1', port=1502, filename='weather.txt'):
+    def __init__(self, group='233.0.0.1', port=1502, filename='weather.txt', feeds=None,
+                 watch='auto', poll_interval=0.05, heartbeat_interval=1.0, catchup_port=1504,
+                 history_size=256):
         self.group = group
         self.port = port
         self.filename = filename
+        # Каждый файл рассылается в свой канал (группа и порт)
+        feeds = feeds or [(filename, group, port)]
+        self.feeds = [Feed(channel, *feed) for channel, feed in enumerate(feeds)]
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.catchup_port = catchup_port
+        self.history_size = history_size
+        self.session = new_session()
+        self.lock = threading.Lock()  # sent читают потоки догрузки
+        self.running = False
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
-    
-    def read_message(self):
+
+    def read_message(self, feed=None):
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
+            with open(feed.filename if feed else self.filename, 'r', encoding='utf-8') as f:
                 return f.read().strip()
         except:
             return "Сообщение по умолчанию"
-    
+
+    def publish(self, feed):
+        """Перечитать файл и разослать, если текст изменился"""
+        text = self.read_message(feed)
+        if text == feed.message:
+            return False
+        feed.seq += 1
+        message = Message(feed.channel, self.session, feed.seq, now_us(), text.encode('utf-8'))
+        with self.lock:
+            feed.sent[feed.seq] = message
+            while len(feed.sent) > self.history_size:
+                feed.sent.popitem(last=False)
+        for datagram in encode_message(message):
+            self.sock.sendto(datagram, (feed.group, feed.port))
+        feed.message = text
+        print(f"Отправлено в {feed.group}:{feed.port} #{feed.seq}: {text}")
+        return True
+
+    def send_heartbeats(self):
+        for feed in self.feeds:
+            self.sock.sendto(encode_heartbeat(feed.channel, self.session, feed.seq), (feed.group, feed.port))
+
+    def lookup(self, channel, seqs):
+        """Сообщения канала с данными номерами (какие еще хранятся)"""
+        if not 0 <= channel < len(self.feeds):
+            return []
+        with self.lock:
+            sent = self.feeds[channel].sent
+            return [sent[seq] for seq in seqs if seq in sent]
+
     def start(self):
-        print(f"Сервер запущен: {self.group}:{self.port}")
-        last_message = ""
+        for feed in self.feeds:
+            print(f"Сервер запущен: {feed.filename} -> {feed.group}:{feed.port}")
+        feeds = {feed.filename: feed for feed in self.feeds}
+        # Наблюдатель создается до первой рассылки, чтобы не пропустить запись между ними
+        watcher = create_watcher(list(feeds), self.watch, self.poll_interval)
+        print(f"Отслеживание изменений: {type(watcher).__name__}")
+        catchup = None
+        if self.catchup_port:
+            catchup = CatchupServer(('', self.catchup_port), CatchupHandler)
+            catchup.udp_server = self
+            threading.Thread(target=catchup.serve_forever, daemon=True).start()
+            print(f"Догрузка пропущенных сообщений: TCP-порт {self.catchup_port}")
+        self.running = True
+        try:
+            for feed in self.feeds:
+                self.publish(feed)
+            next_heartbeat = time.monotonic() + self.heartbeat_interval
+            # Файлы читаются только после события об их изменении
+            while self.running:
+                for path in watcher.wait(timeout=max(0.0, min(0.5, next_heartbeat - time.monotonic()))):
+                    self.publish(feeds[path])
+                if time.monotonic() >= next_heartbeat:
+                    self.send_heartbeats()
+                    next_heartbeat = time.monotonic() + self.heartbeat_interval
+        finally:
+            watcher.close()
+            if catchup is not None:
+                catchup.shutdown()
+                catchup.server_close()
+
+    def stop(self):
+        self.running = False
+
+def parse_feed(text):
+    """FILE=GROUP:PORT"""
+    filename, _, channel = text.partition('=')
+    group, _, port = channel.rpartition(':')
+    if not filename or not group or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"ожидалось FILE=GROUP:PORT: {text}")
+    return filename, group, int(port)
+
+def open_receiver(group, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    if ipaddress.ip_address(group).is_multicast:
+        mreq = socket.inet_aton(group) + socket.inet_aton('0.0.0.0')
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+def measure_latency(count, group, port, watch, poll_interval):
+    """Задержка от записи файла до приема датаграммы подписчиком"""
+    path = os.path.join(tempfile.mkdtemp(prefix='lab4_'), 'feed.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('начало')
+    receiver = open_receiver(group, port)
+    receiver.settimeout(5)
+    server = UDPServer(feeds=[(path, group, port)], watch=watch, poll_interval=poll_interval,
+                       catchup_port=None)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+
+    def receive_text():
         while True:
-            current_message = self.read_message()
-            if current_message != last_message:
-                self.sock.sendto(current_message.encode('utf-8'), (self.group, self.port))
-                print(f"Отправлено: {current_message}")
-                last_message = current_message
-            time.sleep(10)
+            try:
+                frame = decode_frame(receiver.recvfrom(65536)[0])
+            except ProtocolError:
+                continue
+            if frame.kind != HEARTBEAT:
+                return frame.payload.decode('utf-8')
+
+    receive_text()  # первая рассылка при запуске
+
+    latencies = []
+    for i in range(count):
+        message = f'замер {i}'
+        started = time.perf_counter()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(message)
+        while receive_text() != message:
+            pass
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+    server.stop()
+    thread.join()
+
+    latencies.sort()
+    pick = lambda fraction: 1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+    print(f"Замеров: {count}, p50 {pick(0.5):.2f} мс, p95 {pick(0.95):.2f} мс, "
+          f"максимум {1000 * latencies[-1]:.2f} мс")
 
 if __name__ == "__main__":
-    UDPServer().start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Рассылка файлов погоды по UDP multicast")
+    parser.add_argument('--feed', action='append', type=parse_feed, default=[],
+                        help="FILE=GROUP:PORT, можно несколько (по умолчанию weather.txt=233.0.0.1:1502)")
+    parser.add_argument('--watch', choices=('auto', 'inotify', 'poll'), default='auto',
+                        help="способ отслеживания изменений")
+    parser.add_argument('--poll-interval', type=float, default=0.05, help="период опроса stat, с")
+    parser.add_argument('--heartbeat', type=float, default=1.0, help="период пульса, с")
+    parser.add_argument('--catchup-port', type=int, default=1504,
+                        help="TCP-порт догрузки пропущенных сообщений (0 - выключить)")
+    parser.add_argument('--measure-latency', type=int, metavar='N',
+                        help="замерить задержку обновления на N записях и выйти")
+    parser.add_argument('--group', default='233.0.0.1', help="группа для --measure-latency")
+    parser.add_argument('--port', type=int, default=1502, help="порт для --measure-latency")
+    args = parser.parse_args()
+
+    if args.measure_latency:
+        measure_latency(args.measure_latency, args.group, args.port, args.watch, args.poll_interval)
+    else:
+        UDPServer(feeds=args.feed, watch=args.watch, poll_interval=args.poll_interval,
+                  heartbeat_interval=args.heartbeat, catchup_port=args.catchup_port).start()
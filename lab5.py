@@ -1,6 +1,27 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from itertools import count, islice
+import json
+from operator import itemgetter
+import os
+from pydantic import BaseModel, ValidationError
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import zlib
+
+try:
+    import orjson
+except ImportError:  # без orjson фрагменты книг строит pydantic
+    orjson = None
 
 # Создаем экземпляр приложения FastAPI
 app = FastAPI(title="Library API", version="1.0.0")
@@ -13,75 +34,1033 @@ class Book(BaseModel):
     year: int
     is_available: bool = True
 
-# Временная "база данных" - список книг
-books_db = [
+def encode_book(book: Book) -> bytes:
+    """JSON одной книги: поля в порядке модели, как в обычном ответе"""
+    if orjson is not None:
+        return orjson.dumps(book.__dict__)
+    return book.__pydantic_serializer__.to_json(book)
+
+# Поля, по которым доступен поиск подстроки
+SEARCH_FIELDS = ("author", "title")
+
+def matches(text: str, query: str, prefix: bool = False) -> bool:
+    """Совпадение без учета регистра: подстрока или начало слова (prefix)"""
+    text = text.lower()
+    query = query.lower()
+    if prefix:
+        return text.startswith(query) or (" " + query) in text
+    return query in text
+
+class SubstringIndex:
+    """Инвертированный индекс триграмм для поиска подстроки без учета
+    регистра. Запрос из GRAM символов и длиннее - пересечение списков его
+    триграмм с проверкой кандидатов. Более короткий запрос - объединение
+    списков триграмм, в которые он входит, и текстов короче GRAM (у них
+    триграмм нет), тоже с проверкой.
+
+    Запись одного doc_id не должна идти из двух потоков сразу (это
+    обеспечивает хранилище), разные doc_id и чтение - без блокировок:
+    операции dict/set атомарны, а пустые списки не удаляются, чтобы
+    параллельная вставка не попала в уже выброшенное множество"""
+
+    GRAM = 3
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = {}
+        self._texts: Dict[int, str] = {}
+        self._short: Set[int] = set()  # doc_id текстов короче GRAM
+
+    def _grams(self, text: str) -> Set[str]:
+        return {text[i:i + self.GRAM] for i in range(len(text) - self.GRAM + 1)}
+
+    def add(self, doc_id: int, text: str) -> None:
+        text = text.lower()
+        self._texts[doc_id] = text
+        if len(text) < self.GRAM:
+            self._short.add(doc_id)
+        for gram in self._grams(text):
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def update(self, doc_id: int, text: str) -> None:
+        """Заменить текст: сначала добавить новые триграммы, затем убрать
+        лишние старые - поиск не теряет документ на время замены"""
+        old_text = self._texts.get(doc_id)
+        text = text.lower()
+        if old_text == text:
+            return
+        grams = self._grams(text)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(doc_id)
+        if len(text) < self.GRAM:
+            self._short.add(doc_id)
+        self._texts[doc_id] = text
+        if old_text is not None:
+            for gram in self._grams(old_text) - grams:
+                self._postings[gram].discard(doc_id)
+        if len(text) >= self.GRAM:
+            self._short.discard(doc_id)
+
+    def remove(self, doc_id: int) -> None:
+        text = self._texts.pop(doc_id, None)
+        if text is None:
+            return
+        self._short.discard(doc_id)
+        for gram in self._grams(text):
+            self._postings[gram].discard(doc_id)
+
+    def search(self, query: str, prefix: bool = False) -> Set[int]:
+        query = query.lower()
+        if not query:
+            return set(self._texts)
+        if len(query) < self.GRAM:
+            # Копии: списки могут меняться параллельной записью
+            candidates = set(self._short)
+            for gram, doc_ids in list(self._postings.items()):
+                if query in gram:
+                    candidates |= doc_ids
+        elif len(query) == self.GRAM:
+            candidates = set(self._postings.get(query, ()))
+            if not prefix:
+                return candidates
+        else:
+            postings = sorted((self._postings.get(query[i:i + self.GRAM], set())
+                               for i in range(len(query) - self.GRAM + 1)), key=len)
+            candidates = set.intersection(*postings)
+        texts = self._texts
+        if prefix:
+            return {doc_id for doc_id in candidates
+                    if (text := texts.get(doc_id, "")).startswith(query) or (" " + query) in text}
+        return {doc_id for doc_id in candidates if query in texts.get(doc_id, "")}
+
+# Хранилище книг: обработчики работают только через этот интерфейс
+class BookRepository(ABC):
+    """Абстрактное хранилище книг"""
+
+    # True - методы выполняют дисковый ввод-вывод и вызываются из пула потоков
+    blocking = False
+
+    # Случайная эпоха данных: версия нового хранилища (например, после
+    # перезапуска) снова начинается с нуля, и без эпохи старый ETag
+    # совпал бы с ETag других данных той же версии
+    epoch = 0
+
+    @abstractmethod
+    def get(self, book_id: int) -> Optional[Book]:
+        """Книга по ID или None"""
+
+    @abstractmethod
+    def add(self, book: Book) -> bool:
+        """Добавить книгу; False, если ID уже занят"""
+
+    @abstractmethod
+    def replace(self, book: Book) -> bool:
+        """Заменить книгу с тем же ID; False, если ее нет"""
+
+    @abstractmethod
+    def delete(self, book_id: int) -> Optional[Book]:
+        """Удалить книгу и вернуть ее, None если ее нет"""
+
+    @abstractmethod
+    def list_all(self) -> List[Book]:
+        """Все книги в порядке добавления"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Количество книг"""
+
+    @property
+    @abstractmethod
+    def version(self) -> int:
+        """Номер версии данных, растет при каждом изменении"""
+
+    def list_page(self, offset: int = 0, limit: Optional[int] = None) -> List[Book]:
+        """Книги с позиции offset, не больше limit штук"""
+        books = self.list_all()
+        return books[offset:] if limit is None else books[offset:offset + limit]
+
+    def iter_pages(self, offset: int = 0, limit: Optional[int] = None,
+                   page_size: int = 1000) -> Iterator[List[Book]]:
+        """Те же книги, что list_page, страницами по page_size (для потоковой выдачи)"""
+        books = self.list_page(offset, limit)
+        for start in range(0, len(books), page_size):
+            yield books[start:start + page_size]
+
+    def add_many(self, books: List[Book]) -> List[bool]:
+        """Добавить пачку книг; для каждой - добавлена ли она"""
+        return [self.add(book) for book in books]
+
+    def replace_many(self, books: List[Book]) -> List[bool]:
+        """Заменить пачку книг; для каждой - найдена ли она"""
+        return [self.replace(book) for book in books]
+
+    def delete_many(self, book_ids: List[int]) -> List[Optional[Book]]:
+        """Удалить пачку книг; для каждого ID - удаленная книга или None"""
+        return [self.delete(book_id) for book_id in book_ids]
+
+    def search(self, field: str, query: str, prefix: bool = False) -> List[Book]:
+        """Книги, у которых поле field содержит query (без учета регистра),
+        в порядке добавления. prefix=True - query в начале слова"""
+        return [book for book in self.list_all() if matches(getattr(book, field), query, prefix)]
+
+    def book_json(self, book: Book) -> bytes:
+        """Готовый JSON книги (хранилище может держать его между запросами)"""
+        return encode_book(book)
+
+    def books_json(self, books: List[Book]) -> bytes:
+        """JSON-массив книг, склеенный из фрагментов book_json"""
+        return b"[" + b",".join(map(self.book_json, books)) + b"]"
+
+class InMemoryBookRepository(BookRepository):
+    """Хранилище в памяти: словарь по ID, get/put/delete за O(1).
+    Словарь сохраняет порядок добавления, замена не меняет позицию книги.
+
+    Безопасно при вызове из нескольких потоков: проверка и изменение одной
+    книги идут под блокировкой ее полосы (LOCK_STRIPES блокировок по ID),
+    так что записи разных книг почти не ждут друг друга. Чтение блокировок
+    не берет: отдельные операции dict/set атомарны, а поиск пропускает
+    книги, удаленные между поиском по индексу и выборкой"""
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, books: Iterable[Book] = ()):
+        self._books: Dict[int, Book] = {}
+        # Порядковый номер добавления (для сортировки результатов поиска)
+        self._positions: Dict[int, int] = {}
+        self._position_counter = count()
+        self._indexes = {field: SubstringIndex() for field in SEARCH_FIELDS}
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        # Сериализованные книги: ID -> (объект книги, JSON), заполняется при чтении
+        self._fragments: Dict[int, Tuple[Book, bytes]] = {}
+        # next() у count атомарен - номера не повторяются без общей блокировки
+        self._version_counter = count(1)
+        self._version = 0
+        self.epoch = int.from_bytes(os.urandom(4), "big")
+        for book in books:
+            self.add(book)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _lock(self, book_id: int) -> threading.Lock:
+        return self._locks[hash(book_id) % self.LOCK_STRIPES]
+
+    def _bump_version(self) -> None:
+        # Номер берется после изменения: кэш не свяжет старую версию с новыми данными
+        self._version = next(self._version_counter)
+
+    def get(self, book_id: int) -> Optional[Book]:
+        return self._books.get(book_id)
+
+    def add(self, book: Book) -> bool:
+        with self._lock(book.id):
+            if book.id in self._books:
+                return False
+            self._positions[book.id] = next(self._position_counter)
+            for field, index in self._indexes.items():
+                index.update(book.id, getattr(book, field))
+            self._books[book.id] = book
+        self._bump_version()
+        return True
+
+    def replace(self, book: Book) -> bool:
+        with self._lock(book.id):
+            if book.id not in self._books:
+                return False
+            self._books[book.id] = book
+            for field, index in self._indexes.items():
+                index.update(book.id, getattr(book, field))
+        self._bump_version()
+        return True
+
+    def delete(self, book_id: int) -> Optional[Book]:
+        with self._lock(book_id):
+            book = self._books.pop(book_id, None)
+            if book is None:
+                return None
+            for index in self._indexes.values():
+                index.remove(book_id)
+            del self._positions[book_id]
+            self._fragments.pop(book_id, None)
+        self._bump_version()
+        return book
+
+    def search(self, field: str, query: str, prefix: bool = False) -> List[Book]:
+        books = self._books
+        positions = self._positions
+        found = []
+        for book_id in self._indexes[field].search(query, prefix):
+            book = books.get(book_id)
+            position = positions.get(book_id)
+            # Книгу могли заменить после поиска по индексу - проверяем ее саму
+            if book is not None and position is not None and matches(getattr(book, field), query, prefix):
+                found.append((position, book))
+        found.sort(key=itemgetter(0))
+        return [book for _, book in found]
+
+    def book_json(self, book: Book) -> bytes:
+        # Фрагмент годен, пока это тот же объект: замена книги кладет новый
+        cached = self._fragments.get(book.id)
+        if cached is not None and cached[0] is book:
+            return cached[1]
+        fragment = encode_book(book)
+        if self._books.get(book.id) is book:
+            self._fragments[book.id] = (book, fragment)
+        return fragment
+
+    def list_all(self) -> List[Book]:
+        return list(self._books.values())
+
+    def count(self) -> int:
+        return len(self._books)
+
+    def list_page(self, offset: int = 0, limit: Optional[int] = None) -> List[Book]:
+        stop = None if limit is None else offset + limit
+        return list(islice(self._books.values(), offset, stop))
+
+class SQLiteBookRepository(BookRepository):
+    """Хранилище в SQLite (режим WAL) - общее для нескольких процессов uvicorn.
+    У каждого потока свое соединение; порядок книг - порядок вставки (seq)"""
+
+    blocking = True
+
+    _COLUMNS = "id, title, author, year, is_available"
+    _INSERT = (f"INSERT INTO books ({_COLUMNS}, author_lower, title_lower) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    _UPDATE = ("UPDATE books SET title = ?, author = ?, year = ?, is_available = ?, "
+               "author_lower = ?, title_lower = ? WHERE id = ?")
+    _DELETE = f"DELETE FROM books WHERE id = ? RETURNING {_COLUMNS}"
+
+    def __init__(self, path: str, books: Iterable[Book] = ()):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS books (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER NOT NULL UNIQUE,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                is_available INTEGER NOT NULL,
+                author_lower TEXT NOT NULL,
+                title_lower TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS books_author_lower ON books (author_lower);
+            CREATE INDEX IF NOT EXISTS books_title_lower ON books (title_lower);
+            -- Версия данных меняется триггерами в той же транзакции, что и запись
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+            -- Эпоха выбирается при создании базы и общая для всех процессов
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', abs(random() % 4294967296));
+            CREATE TRIGGER IF NOT EXISTS books_version_insert AFTER INSERT ON books
+                BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+            CREATE TRIGGER IF NOT EXISTS books_version_update AFTER UPDATE ON books
+                BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+            CREATE TRIGGER IF NOT EXISTS books_version_delete AFTER DELETE ON books
+                BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+        """)
+        self.epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        self._fts = self._create_fts(conn)
+        # Начальные книги добавляются только при первом запуске
+        if self.count() == 0:
+            with self._transaction() as conn:
+                conn.executemany(self._INSERT.replace("INSERT", "INSERT OR IGNORE"),
+                                 [self._row(book) for book in books])
+
+    @staticmethod
+    def _create_fts(conn: sqlite3.Connection) -> bool:
+        """Триграммный индекс FTS5 по author_lower и title_lower для поиска
+        подстроки; False - в этой сборке SQLite нет FTS5 (поиск просмотром)"""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'").fetchone()
+        try:
+            conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                    author_lower, title_lower, content='books', content_rowid='seq',
+                    tokenize='trigram');
+                CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+                    INSERT INTO books_fts (rowid, author_lower, title_lower)
+                        VALUES (new.seq, new.author_lower, new.title_lower);
+                END;
+                CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+                    INSERT INTO books_fts (books_fts, rowid, author_lower, title_lower)
+                        VALUES ('delete', old.seq, old.author_lower, old.title_lower);
+                END;
+                CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+                    INSERT INTO books_fts (books_fts, rowid, author_lower, title_lower)
+                        VALUES ('delete', old.seq, old.author_lower, old.title_lower);
+                    INSERT INTO books_fts (rowid, author_lower, title_lower)
+                        VALUES (new.seq, new.author_lower, new.title_lower);
+                END;
+            """)
+        except sqlite3.OperationalError:
+            return False
+        if not exists:
+            # База создана до появления индекса - заполняем его по таблице
+            conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+        return True
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: автокоммит, транзакции - через _transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row(book: Book) -> Tuple:
+        return (book.id, book.title, book.author, book.year, int(book.is_available),
+                book.author.lower(), book.title.lower())
+
+    @staticmethod
+    def _book(row: Tuple) -> Book:
+        # Данные из таблицы уже проверены при записи
+        return Book.model_construct(id=row[0], title=row[1], author=row[2], year=row[3],
+                                    is_available=bool(row[4]))
+
+    def _select(self, where: str = "", params: Tuple = (), tail: str = "") -> List[Book]:
+        cursor = self._connection().execute(
+            f"SELECT {self._COLUMNS} FROM books {where} ORDER BY seq {tail}", params)
+        return [self._book(row) for row in cursor]
+
+    def get(self, book_id: int) -> Optional[Book]:
+        books = self._select("WHERE id = ?", (book_id,))
+        return books[0] if books else None
+
+    def add(self, book: Book) -> bool:
+        try:
+            self._connection().execute(self._INSERT, self._row(book))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def replace(self, book: Book) -> bool:
+        row = self._row(book)
+        return self._connection().execute(self._UPDATE, row[1:] + row[:1]).rowcount > 0
+
+    def delete(self, book_id: int) -> Optional[Book]:
+        row = self._connection().execute(self._DELETE, (book_id,)).fetchone()
+        return None if row is None else self._book(row)
+
+    # Пакетные операции - одна транзакция на пачку
+    def add_many(self, books: List[Book]) -> List[bool]:
+        insert = self._INSERT.replace("INSERT", "INSERT OR IGNORE")
+        with self._transaction() as conn:
+            return [conn.execute(insert, self._row(book)).rowcount > 0 for book in books]
+
+    def replace_many(self, books: List[Book]) -> List[bool]:
+        rows = [self._row(book) for book in books]
+        with self._transaction() as conn:
+            return [conn.execute(self._UPDATE, row[1:] + row[:1]).rowcount > 0 for row in rows]
+
+    def delete_many(self, book_ids: List[int]) -> List[Optional[Book]]:
+        with self._transaction() as conn:
+            rows = [conn.execute(self._DELETE, (book_id,)).fetchone() for book_id in book_ids]
+        return [None if row is None else self._book(row) for row in rows]
+
+    def list_all(self) -> List[Book]:
+        return self._select()
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    @property
+    def version(self) -> int:
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def list_page(self, offset: int = 0, limit: Optional[int] = None) -> List[Book]:
+        return self._select(tail="LIMIT ? OFFSET ?", params=(-1 if limit is None else limit, offset))
+
+    def iter_pages(self, offset: int = 0, limit: Optional[int] = None,
+                   page_size: int = 1000) -> Iterator[List[Book]]:
+        # Постранично по seq: первая страница пропускает offset строк,
+        # следующие продолжают после последнего seq - в памяти одна страница
+        last_seq = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            if last_seq is None:
+                rows = self._connection().execute(
+                    f"SELECT seq, {self._COLUMNS} FROM books ORDER BY seq LIMIT ? OFFSET ?",
+                    (size, offset)).fetchall()
+            else:
+                rows = self._connection().execute(
+                    f"SELECT seq, {self._COLUMNS} FROM books WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (last_seq, size)).fetchall()
+            if not rows:
+                return
+            last_seq = rows[-1][0]
+            yield [self._book(row[1:]) for row in rows]
+            if len(rows) < size:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def search(self, field: str, query: str, prefix: bool = False) -> List[Book]:
+        if field not in SEARCH_FIELDS:
+            raise ValueError(f"Поиск по полю {field} не поддерживается")
+        column = f"{field}_lower"
+        query = query.lower()
+        if not query:
+            return self._select()
+        if prefix:
+            # Начало строки - диапазон по индексу столбца, начало слова -
+            # подстрока " " + query по триграммам; условие проверяет кандидатов
+            starts = f"{column} >= ? AND {column} < ?"
+            bounds = (query, query + "\U0010ffff")
+            condition = f"(({starts}) OR instr({column}, ?) > 0)"
+            fts = self._fts_seqs(column, " " + query)
+            if fts is None:
+                return self._select(f"WHERE {condition}", bounds + (" " + query,))
+            return self._select(f"WHERE seq IN (SELECT seq FROM books WHERE {starts} UNION {fts[0]}) "
+                                f"AND {condition}", bounds + fts[1] + bounds + (" " + query,))
+        fts = self._fts_seqs(column, query)
+        if fts is None:
+            return self._select(f"WHERE instr({column}, ?) > 0", (query,))
+        return self._select(f"WHERE seq IN ({fts[0]}) AND instr({column}, ?) > 0", fts[1] + (query,))
+
+    def _fts_seqs(self, column: str, text: str) -> Optional[Tuple[str, Tuple]]:
+        """Подзапрос seq книг, у которых column содержит text, по индексу FTS5.
+        None - индекса нет или text короче триграммы (тогда просмотр таблицы)"""
+        if not self._fts or len(text) < 3:
+            return None
+        return (f"SELECT rowid FROM books_fts WHERE {column} MATCH ?",
+                ('"' + text.replace('"', '""') + '"',))
+
+# Метрики: гистограммы задержек по маршрутам, размеры ответов, этапы запроса
+class Histogram:
+    """Гистограмма с фиксированными границами (как в Prometheus)"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+
+class Metrics:
+    """Метрики HTTP-запросов текущего процесса в формате Prometheus"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: Dict[Tuple[str, str, int], Histogram] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.stages: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float,
+                        size: int, stages: Dict[str, float]) -> None:
+        key = (method, route, status)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+        histogram = self.response_size.get(key[:2])
+        if histogram is None:
+            histogram = self.response_size[key[:2]] = Histogram(SIZE_BUCKETS)
+        histogram.observe(size)
+        for stage, stage_seconds in stages.items():
+            histogram = self.stages.get((route, stage))
+            if histogram is None:
+                histogram = self.stages[(route, stage)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(stage_seconds)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests being processed",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds Request latency by route",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), histogram in sorted(self.latency.items()):
+            lines += histogram.render("http_request_duration_seconds",
+                                      f'method="{method}",route="{route}",status="{status}"')
+        lines += ["# HELP http_response_size_bytes Response body size by route",
+                  "# TYPE http_response_size_bytes histogram"]
+        for (method, route), histogram in sorted(self.response_size.items()):
+            lines += histogram.render("http_response_size_bytes", f'method="{method}",route="{route}"')
+        lines += ["# HELP http_request_stage_seconds Time spent in storage and serialization",
+                  "# TYPE http_request_stage_seconds histogram"]
+        for (route, stage), histogram in sorted(self.stages.items()):
+            lines += histogram.render("http_request_stage_seconds", f'route="{route}",stage="{stage}"')
+        cache = response_cache.stats()
+        lines += ["# HELP response_cache_hits_total Response cache hits",
+                  "# TYPE response_cache_hits_total counter",
+                  f"response_cache_hits_total {cache['hits']}",
+                  "# HELP response_cache_misses_total Response cache misses",
+                  "# TYPE response_cache_misses_total counter",
+                  f"response_cache_misses_total {cache['misses']}",
+                  "# HELP response_cache_bytes Bytes held by the response cache",
+                  "# TYPE response_cache_bytes gauge",
+                  f"response_cache_bytes {cache['bytes']}"]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# Длительности этапов текущего запроса (None - запрос не измеряется)
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+@contextmanager
+def timing_span(stage: str) -> Iterator[None]:
+    """Учесть время блока как этап stage текущего запроса"""
+    stages = _request_stages.get()
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started
+
+class MetricsMiddleware:
+    """ASGI-промежуточный слой: задержка, размер ответа и этапы по маршрутам"""
+
+    def __init__(self, app: Any, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+        stages: Dict[str, float] = {}
+        token = _request_stages.set(stages)
+
+        async def send_with_metrics(message: Dict[str, Any]) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            self.metrics.in_flight -= 1
+            _request_stages.reset(token)
+            # Шаблон маршрута вместо пути, чтобы число меток не росло
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.observe_request(scope["method"], route, status,
+                                         time.perf_counter() - started, size, stages)
+
+if os.environ.get("LIBRARY_METRICS", "1") != "0":
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+async def run_repository(repo: BookRepository, func: Callable[..., Any], *args: Any) -> Any:
+    """Вызвать метод хранилища, не блокируя цикл событий дисковым вводом-выводом"""
+    with timing_span("storage"):
+        if repo.blocking:
+            return await run_in_threadpool(func, *args)
+        return func(*args)
+
+INITIAL_BOOKS = [
     Book(id=1, title="Преступление и наказание", author="Федор Достоевский", year=1866, is_available=True),
     Book(id=2, title="Война и мир", author="Лев Толстой", year=1869, is_available=False),
     Book(id=3, title="Мастер и Маргарита", author="Михаил Булгаков", year=1967, is_available=True),
 ]
 
+# "База данных": файл SQLite из LIBRARY_DB (общий для всех процессов) или книги в памяти
+LIBRARY_DB = os.environ.get("LIBRARY_DB")
+books_db: BookRepository = (SQLiteBookRepository(LIBRARY_DB, INITIAL_BOOKS) if LIBRARY_DB
+                            else InMemoryBookRepository(INITIAL_BOOKS))
+
+# Зависимость: хранилище для обработчиков (подменяется через dependency_overrides)
+def get_repository() -> BookRepository:
+    return books_db
+
+# Быстрая сериализация (LIBRARY_FAST_JSON=1): книги берутся готовыми
+# JSON-фрагментами из хранилища, остальное кодирует orjson (если установлен)
+FAST_JSON = os.environ.get("LIBRARY_FAST_JSON", "0") == "1"
+
+def serialize(repo: BookRepository, content: Any) -> bytes:
+    """Тело JSON-ответа для данных из build()"""
+    if FAST_JSON:
+        if isinstance(content, Book):
+            return repo.book_json(content)
+        if isinstance(content, list) and content and isinstance(content[0], Book):
+            return repo.books_json(content)
+        if orjson is not None:
+            return orjson.dumps(content)
+    return JSONResponse(jsonable_encoder(content)).body
+
+class ResponseCache:
+    """LRU-кэш сериализованных ответов. Запись действительна, пока версия
+    хранилища не изменилась; размер ограничен числом записей и байтами"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[int, bytes, Dict[str, str]]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: int) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(self, key: str, version: int, body: bytes, headers: Dict[str, str]) -> None:
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (version, body, headers)
+        self._bytes += len(body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        _, body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+        }
+
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("LIBRARY_CACHE_ENTRIES", "1024")),
+    max_bytes=int(os.environ.get("LIBRARY_CACHE_BYTES", str(64 * 1024 * 1024))),
+)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match (слабое сравнение)"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+async def cached_response(request: Request, repo: BookRepository,
+                          build: Callable[[], Tuple[Any, Dict[str, str]]]) -> Response:
+    """Ответ чтения с кэшем и ETag. build() возвращает (данные, заголовки)
+    и вызывается только при промахе кэша. ETag и ключ кэша включают эпоху
+    хранилища: версии разных хранилищ (и запусков) не путаются"""
+    url = request.url.path + "?" + request.url.query
+    key = f"{repo.epoch:08x}:{url}"
+    version = await run_repository(repo, lambda: repo.version)
+    etag = f'W/"{repo.epoch:08x}-{version}-{zlib.crc32(url.encode("utf-8")):08x}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = response_cache.get(key, version)
+    if cached is not None:
+        body, headers = cached
+    else:
+        content, headers, version_after = await run_repository(
+            repo, lambda: build() + (repo.version,))
+        with timing_span("serialize"):
+            body = serialize(repo, content)
+        if version_after != version:
+            # Данные изменились во время чтения - не кэшируем и не обещаем ETag
+            return Response(body, media_type="application/json", headers=headers)
+        response_cache.put(key, version, body, headers)
+    return Response(body, media_type="application/json", headers={**headers, "ETag": etag})
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_CHUNK_SIZE = 1000  # строк в одном фрагменте потокового ответа
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Разобрать список полей через запятую; None - все поля"""
+    if fields is None:
+        return None
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected - set(Book.model_fields)
+    if not selected or unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return selected
+
+def iter_ndjson(repo: BookRepository, pages: Iterable[List[Book]],
+                include: Optional[Set[str]]) -> Iterator[bytes]:
+    """Книги построчно в NDJSON, по фрагменту на страницу из repo.iter_pages"""
+    for chunk in pages:
+        if FAST_JSON and include is None:
+            yield b"".join(repo.book_json(book) + b"\n" for book in chunk)
+        else:
+            yield "".join(book.model_dump_json(include=include) + "\n" for book in chunk).encode("utf-8")
+
 # GET - Получить все книги
 @app.get("/books", response_model=List[Book])
-async def get_all_books():
+async def get_all_books(
+    request: Request,
+    offset: int = Query(0, ge=0, description="Сколько книг пропустить"),
+    limit: Optional[int] = Query(None, ge=1, description="Сколько книг вернуть (по умолчанию все)"),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например id,title"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json или ndjson (потоковый вывод)"),
+    repo: BookRepository = Depends(get_repository),
+):
     """Получить список всех книг"""
-    return books_db
+    include = parse_fields(fields)
+    if format == "ndjson":
+        total = await run_repository(repo, repo.count)
+        # Страницы читаются по мере отправки (синхронный итератор
+        # StreamingResponse выполняет в пуле потоков)
+        pages = repo.iter_pages(offset, limit, NDJSON_CHUNK_SIZE)
+        return StreamingResponse(iter_ndjson(repo, pages, include), media_type=NDJSON_MEDIA_TYPE,
+                                 headers={"X-Total-Count": str(total)})
+
+    def build() -> Tuple[Any, Dict[str, str]]:
+        books = repo.list_page(offset, limit)
+        content = books if include is None else [book.model_dump(include=include) for book in books]
+        return content, {"X-Total-Count": str(repo.count())}
+
+    return await cached_response(request, repo, build)
+
+# Пакетные операции: тело - JSON-массив или поток NDJSON (application/x-ndjson)
+BULK_BATCH_SIZE = 1000  # элементов на одно обращение к хранилищу
+
+def bulk_body_schema(item_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Описание тела пакетного запроса для OpenAPI"""
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": item_schema}},
+        NDJSON_MEDIA_TYPE: {"schema": item_schema},
+    }}}
+
+BOOK_SCHEMA_REF = {"$ref": "#/components/schemas/Book"}
+
+async def read_bulk_items(request: Request) -> AsyncIterator[List[Any]]:
+    """Элементы тела запроса пачками. Строки NDJSON читаются из потока
+    по мере поступления и отдаются как bytes, элементы JSON-массива - как есть"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == NDJSON_MEDIA_TYPE:
+        batch: List[Any] = []
+        tail = b""
+        async for chunk in request.stream():
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                if line.strip():
+                    batch.append(line)
+                if len(batch) >= BULK_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if tail.strip():
+            batch.append(tail)
+        if batch:
+            yield batch
+        return
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Тело запроса должно быть JSON-массивом или NDJSON")
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        yield items[start:start + BULK_BATCH_SIZE]
+
+def parse_bulk_book(item: Any) -> Book:
+    return Book.model_validate_json(item) if isinstance(item, bytes) else Book.model_validate(item)
+
+def parse_bulk_id(item: Any) -> int:
+    value = json.loads(item) if isinstance(item, bytes) else item
+    if isinstance(value, dict):
+        value = value.get("id")
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("Ожидался целочисленный ID")
+    return value
+
+def describe_error(error: ValueError) -> str:
+    """Краткое описание ошибки разбора элемента пакета"""
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}"
+                         for item in error.errors(include_url=False))
+    return str(error)
+
+async def apply_bulk(request: Request, repo: BookRepository, parse: Callable[[Any], Any],
+                     apply: Callable[[List[Any]], List[Any]], done_status: str,
+                     failed_status: str) -> Dict[str, Any]:
+    """Разобрать элементы, применить их пачками и вернуть статус по каждому"""
+    results: List[Dict[str, Any]] = []
+    index = 0
+    async for items in read_bulk_items(request):
+        parsed = []
+        positions = []
+        for item in items:
+            try:
+                value = parse(item)
+            except ValueError as e:
+                results.append({"index": index, "id": None, "status": "invalid",
+                                "detail": describe_error(e)})
+            else:
+                positions.append(len(results))
+                results.append({"index": index, "id": getattr(value, "id", value), "status": None})
+                parsed.append(value)
+            index += 1
+        if parsed:
+            outcomes = await run_repository(repo, apply, parsed)
+            for position, outcome in zip(positions, outcomes):
+                results[position]["status"] = done_status if outcome else failed_status
+    succeeded = sum(1 for result in results if result["status"] == done_status)
+    return {"total": len(results), "succeeded": succeeded,
+            "failed": len(results) - succeeded, "results": results}
+
+# POST - Добавить много книг
+@app.post("/books/bulk", openapi_extra=bulk_body_schema(BOOK_SCHEMA_REF))
+async def create_books_bulk(request: Request, repo: BookRepository = Depends(get_repository)):
+    """Добавить книги пачкой: статус created, exists или invalid для каждой"""
+    return await apply_bulk(request, repo, parse_bulk_book, repo.add_many, "created", "exists")
+
+# PUT - Обновить много книг
+@app.put("/books/bulk", openapi_extra=bulk_body_schema(BOOK_SCHEMA_REF))
+async def update_books_bulk(request: Request, repo: BookRepository = Depends(get_repository)):
+    """Обновить книги пачкой: статус updated, not_found или invalid для каждой"""
+    return await apply_bulk(request, repo, parse_bulk_book, repo.replace_many, "updated", "not_found")
+
+# DELETE - Удалить много книг
+@app.delete("/books/bulk", openapi_extra=bulk_body_schema({"type": "integer"}))
+async def delete_books_bulk(request: Request, repo: BookRepository = Depends(get_repository)):
+    """Удалить книги по списку ID: статус deleted, not_found или invalid для каждой"""
+    return await apply_bulk(request, repo, parse_bulk_id, repo.delete_many, "deleted", "not_found")
 
 # GET - Получить книгу по ID
 @app.get("/books/{book_id}", response_model=Book)
-async def get_book(book_id: int):
+async def get_book(book_id: int, request: Request, repo: BookRepository = Depends(get_repository)):
     """Получить книгу по её ID"""
-    book = next((book for book in books_db if book.id == book_id), None)
-    if book is None:
-        raise HTTPException(status_code=404, detail="Книга не найдена")
-    return book
+    def build() -> Tuple[Any, Dict[str, str]]:
+        book = repo.get(book_id)
+        if book is None:
+            raise HTTPException(status_code=404, detail="Книга не найдена")
+        return book, {}
+
+    return await cached_response(request, repo, build)
 
 # POST - Добавить новую книгу
 @app.post("/books", response_model=Book)
-async def create_book(book: Book):
+async def create_book(book: Book, repo: BookRepository = Depends(get_repository)):
     """Добавить новую книгу в библиотеку"""
-    # Проверяем, существует ли книга с таким ID
-    existing_book = next((b for b in books_db if b.id == book.id), None)
-    if existing_book:
+    # Добавление не проходит, если книга с таким ID уже существует
+    if not await run_repository(repo, repo.add, book):
         raise HTTPException(status_code=400, detail="Книга с таким ID уже существует")
-    
-    books_db.append(book)
     return book
 
 # PUT - Обновить информацию о книге
 @app.put("/books/{book_id}", response_model=Book)
-async def update_book(book_id: int, updated_book: Book):
+async def update_book(book_id: int, updated_book: Book, repo: BookRepository = Depends(get_repository)):
     """Обновить информацию о книге"""
     if updated_book.id != book_id:
         raise HTTPException(status_code=400, detail="ID в пути и в теле запроса не совпадают")
     
-    book_index = next((index for index, book in enumerate(books_db) if book.id == book_id), None)
-    if book_index is None:
+    if not await run_repository(repo, repo.replace, updated_book):
         raise HTTPException(status_code=404, detail="Книга не найдена")
-    
-    books_db[book_index] = updated_book
     return updated_book
 
 # DELETE - Удалить книгу
 @app.delete("/books/{book_id}")
-async def delete_book(book_id: int):
+async def delete_book(book_id: int, repo: BookRepository = Depends(get_repository)):
     """Удалить книгу из библиотеки"""
-    book_index = next((index for index, book in enumerate(books_db) if book.id == book_id), None)
-    if book_index is None:
+    deleted_book = await run_repository(repo, repo.delete, book_id)
+    if deleted_book is None:
         raise HTTPException(status_code=404, detail="Книга не найдена")
     
-    deleted_book = books_db.pop(book_index)
     return {"message": f"Книга '{deleted_book.title}' удалена", "deleted_book": deleted_book}
 
 # GET - Поиск книг по автору
 @app.get("/books/search/{author}")
-async def search_books_by_author(author: str):
+async def search_books_by_author(
+    author: str,
+    request: Request,
+    mode: str = Query("substring", pattern="^(substring|prefix)$", description="substring или prefix (начало слова)"),
+    repo: BookRepository = Depends(get_repository),
+):
     """Поиск книг по автору"""
-    found_books = [book for book in books_db if author.lower() in book.author.lower()]
-    if not found_books:
-        raise HTTPException(status_code=404, detail="Книги данного автора не найдены")
-    return found_books
+    def build() -> Tuple[Any, Dict[str, str]]:
+        found_books = repo.search("author", author, mode == "prefix")
+        if not found_books:
+            raise HTTPException(status_code=404, detail="Книги данного автора не найдены")
+        return found_books, {}
+
+    return await cached_response(request, repo, build)
+
+# GET - Поиск книг по названию
+@app.get("/books/search/title/{title}", response_model=List[Book])
+async def search_books_by_title(
+    title: str,
+    request: Request,
+    mode: str = Query("substring", pattern="^(substring|prefix)$", description="substring или prefix (начало слова)"),
+    repo: BookRepository = Depends(get_repository),
+):
+    """Поиск книг по названию"""
+    def build() -> Tuple[Any, Dict[str, str]]:
+        found_books = repo.search("title", title, mode == "prefix")
+        if not found_books:
+            raise HTTPException(status_code=404, detail="Книги с таким названием не найдены")
+        return found_books, {}
+
+    return await cached_response(request, repo, build)
+
+# GET - Метрики в формате Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# GET - Состояние кэша ответов
+@app.get("/cache/stats", include_in_schema=False)
+async def get_cache_stats():
+    """Попадания, промахи и занятая память кэша ответов"""
+    return response_cache.stats()
 
-# Запуск приложения
+# Запуск приложения (несколько процессов - только вместе с LIBRARY_DB)
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run("lab5:app", host="0.0.0.0", port=8000,
+                workers=int(os.environ.get("LIBRARY_WORKERS", "1")))
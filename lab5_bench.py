@@ -0,0 +1,387 @@
+"""Нагрузочный тест Library API (lab5).
+
+Запросы идут к lab5.app напрямую через ASGI (httpx.ASGITransport) или к
+локальному uvicorn (--uvicorn). Для каждого размера каталога хранилище
+заполняется заново и подставляется через app.dependency_overrides.
+
+Режим --stress проверяет само хранилище под конкуренцией потоков: потоки
+одновременно пишут пересекающиеся ID и читают, после чего проверяются
+инварианты (число книг, согласованность get/list/search с индексом).
+
+Пример:
+    python lab5_bench.py --sizes 1000,100000 --mix get=50,search=20,create=10 \
+        --requests 20000 --concurrency 32 --output bench_results.json
+    python lab5_bench.py --stress --threads 1,4,16 --sizes 10000 --stress-ops 20000
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+import lab5
+
+OPERATIONS = ("list", "get", "search", "create", "update", "delete")
+DEFAULT_MIX = {"list": 5, "get": 40, "search": 20, "create": 15, "update": 15, "delete": 5}
+SEED_BATCH_SIZE = 10000
+AUTHORS = 1000  # различных авторов в каталоге
+
+def make_book(book_id: int, rng: random.Random) -> lab5.Book:
+    author = rng.randrange(AUTHORS)
+    return lab5.Book(id=book_id, title=f"Книга номер {book_id}", author=f"Автор {author} Фамилия{author}",
+                     year=1800 + book_id % 225, is_available=bool(book_id % 2))
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"неизвестная операция: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+def create_repository(backend: str, size: int, rng: random.Random) -> lab5.BookRepository:
+    """Новое хранилище с каталогом из size книг (ID 1..size)"""
+    if backend == "sqlite":
+        path = os.path.join(tempfile.mkdtemp(prefix="lab5_bench_"), "library.db")
+        repo: lab5.BookRepository = lab5.SQLiteBookRepository(path)
+    else:
+        repo = lab5.InMemoryBookRepository()
+    for start in range(1, size + 1, SEED_BATCH_SIZE):
+        stop = min(start + SEED_BATCH_SIZE, size + 1)
+        repo.add_many([make_book(book_id, rng) for book_id in range(start, stop)])
+    return repo
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Процентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies: List[float], statuses: Dict[int, int], errors: int) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "mean_ms": 1000 * sum(values) / len(values) if values else 0.0,
+        "p50_ms": 1000 * percentile(values, 0.50),
+        "p95_ms": 1000 * percentile(values, 0.95),
+        "p99_ms": 1000 * percentile(values, 0.99),
+        "max_ms": 1000 * values[-1] if values else 0.0,
+    }
+
+class Workload:
+    """Генератор запросов по заданной смеси операций.
+    Ведет список существующих ID, чтобы get/update/delete попадали в каталог"""
+
+    # Ожидаемые коды ответа: остальные считаются ошибками
+    EXPECTED = {
+        "list": {200}, "get": {200, 404}, "search": {200, 404},
+        "create": {200, 400}, "update": {200, 404}, "delete": {200, 404},
+    }
+
+    def __init__(self, size: int, mix: Dict[str, int], list_limit: int, rng: random.Random):
+        self.ids = list(range(1, size + 1))
+        self.next_id = size + 1
+        self.operations = [name for name in mix if mix[name] > 0]
+        self.weights = [mix[name] for name in self.operations]
+        self.list_limit = list_limit
+        self.rng = rng
+
+    def _existing_id(self) -> int:
+        return self.rng.choice(self.ids) if self.ids else 1
+
+    def next_request(self) -> Dict[str, Any]:
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        if operation == "list":
+            offset = self.rng.randrange(max(1, len(self.ids) - self.list_limit + 1))
+            return {"op": operation, "method": "GET", "url": f"/books?offset={offset}&limit={self.list_limit}"}
+        if operation == "get":
+            return {"op": operation, "method": "GET", "url": f"/books/{self._existing_id()}"}
+        if operation == "search":
+            return {"op": operation, "method": "GET", "url": f"/books/search/Автор {self.rng.randrange(AUTHORS)} "}
+        if operation == "create":
+            book = make_book(self.next_id, self.rng)
+            self.ids.append(self.next_id)
+            self.next_id += 1
+            return {"op": operation, "method": "POST", "url": "/books", "json": book.model_dump()}
+        if operation == "update":
+            book = make_book(self._existing_id(), self.rng)
+            return {"op": operation, "method": "PUT", "url": f"/books/{book.id}", "json": book.model_dump()}
+        # delete: ID убирается из списка (перестановкой с последним)
+        if not self.ids:
+            return {"op": operation, "method": "DELETE", "url": "/books/0"}
+        index = self.rng.randrange(len(self.ids))
+        self.ids[index], self.ids[-1] = self.ids[-1], self.ids[index]
+        return {"op": operation, "method": "DELETE", "url": f"/books/{self.ids.pop()}"}
+
+async def run_load(client: httpx.AsyncClient, workload: Workload, total_requests: int,
+                   concurrency: int) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {name: [] for name in workload.operations}
+    statuses: Dict[str, Dict[int, int]] = {name: {} for name in workload.operations}
+    errors: Dict[str, int] = {name: 0 for name in workload.operations}
+    remaining = total_requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            request = workload.next_request()
+            operation = request.pop("op")
+            started = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies[operation].append(time.perf_counter() - started)
+            statuses[operation][status] = statuses[operation].get(status, 0) + 1
+            if status not in Workload.EXPECTED[operation]:
+                errors[operation] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    all_statuses: Dict[int, int] = {}
+    for by_status in statuses.values():
+        for status, count in by_status.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    return {
+        "requests": len(all_latencies),
+        "seconds": seconds,
+        "throughput_rps": len(all_latencies) / seconds if seconds else 0.0,
+        "overall": summarize(all_latencies, all_statuses, sum(errors.values())),
+        "operations": {name: summarize(latencies[name], statuses[name], errors[name])
+                       for name in workload.operations},
+    }
+
+class UvicornThread:
+    """Локальный uvicorn с lab5.app в фоновом потоке"""
+
+    def __init__(self, host: str, port: int):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(lab5.app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "UvicornThread":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+async def bench_size(args: argparse.Namespace, size: int, base_url: Optional[str]) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    seed_started = time.perf_counter()
+    repo = create_repository(args.backend, size, rng)
+    seed_seconds = time.perf_counter() - seed_started
+    lab5.app.dependency_overrides[lab5.get_repository] = lambda: repo
+    lab5.response_cache.clear()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if base_url is None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=lab5.app),
+                                   base_url="http://bench", limits=limits)
+    else:
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60)
+    async with client:
+        workload = Workload(size, args.mix, args.list_limit, rng)
+        if args.warmup:
+            await run_load(client, workload, args.warmup, args.concurrency)
+        result = await run_load(client, workload, args.requests, args.concurrency)
+
+    lab5.app.dependency_overrides.pop(lab5.get_repository, None)
+    result.update(size=size, seed_seconds=seed_seconds, cache=lab5.response_cache.stats())
+    return result
+
+STRESS_OPERATIONS = ("get", "search", "list", "add", "replace", "delete")
+STRESS_WEIGHTS = (35, 15, 5, 15, 20, 10)
+
+def stress_worker(repo: lab5.BookRepository, size: int, operations: int, seed: int,
+                  violations: List[str]) -> Dict[str, int]:
+    """Случайные операции над ID 1..2*size; возвращает число успешных add/delete"""
+    rng = random.Random(seed)
+    added = deleted = 0
+    for _ in range(operations):
+        operation = rng.choices(STRESS_OPERATIONS, STRESS_WEIGHTS)[0]
+        book_id = rng.randint(1, 2 * size)
+        if operation == "get":
+            book = repo.get(book_id)
+            if book is not None and book.id != book_id:
+                violations.append(f"get({book_id}) вернул книгу {book.id}")
+        elif operation == "search":
+            query = f"Автор {rng.randrange(AUTHORS)} "
+            for book in repo.search("author", query):
+                if query.lower() not in book.author.lower():
+                    violations.append(f"поиск {query!r} вернул {book.author!r}")
+        elif operation == "list":
+            page = repo.list_page(rng.randrange(size), 100)
+            if len({book.id for book in page}) != len(page):
+                violations.append("повтор ID в странице списка")
+        elif operation == "add":
+            added += repo.add(make_book(book_id, rng))
+        elif operation == "replace":
+            repo.replace(make_book(book_id, rng))
+        else:
+            deleted += repo.delete(book_id) is not None
+    return {"added": added, "deleted": deleted}
+
+def check_repository(repo: lab5.BookRepository, expected_count: int, violations: List[str]) -> None:
+    """Инварианты после нагрузки: счетчики, get и индекс согласованы со списком"""
+    books = repo.list_all()
+    if repo.count() != expected_count or len(books) != expected_count:
+        violations.append(f"ожидалось {expected_count} книг, count()={repo.count()}, list_all={len(books)}")
+    if len({book.id for book in books}) != len(books):
+        violations.append("повтор ID в list_all")
+    for book in books:
+        if repo.get(book.id) != book:
+            violations.append(f"get({book.id}) расходится с list_all")
+    order = {book.id: position for position, book in enumerate(books)}
+    for author in range(AUTHORS):
+        query = f"Автор {author} "
+        expected = [book.id for book in books if query.lower() in book.author.lower()]
+        found = [book.id for book in repo.search("author", query)]
+        if found != expected:
+            violations.append(f"поиск {query!r}: индекс {len(found)}, полный перебор {len(expected)}")
+        if any(order[a] > order[b] for a, b in zip(found, found[1:])):
+            violations.append(f"поиск {query!r}: нарушен порядок добавления")
+
+def stress_size(args: argparse.Namespace, size: int, threads: int) -> Dict[str, Any]:
+    repo = create_repository(args.backend, size, random.Random(args.seed))
+    violations: List[str] = []
+    results: List[Dict[str, int]] = []
+    failures: List[str] = []
+
+    def target(n: int) -> None:
+        try:
+            results.append(stress_worker(repo, size, args.stress_ops, args.seed * 1000 + n, violations))
+        except Exception as error:  # исключение в потоке - тоже нарушение
+            failures.append(f"{type(error).__name__}: {error}")
+
+    workers = [threading.Thread(target=target, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+
+    expected = size + sum(result["added"] - result["deleted"] for result in results)
+    if not failures:
+        check_repository(repo, expected, violations)
+    violations += failures
+    operations = threads * args.stress_ops
+    return {
+        "size": size,
+        "threads": threads,
+        "operations": operations,
+        "seconds": seconds,
+        "ops_per_sec": operations / seconds if seconds else 0.0,
+        "final_count": repo.count(),
+        "violations": len(violations),
+        "violation_samples": violations[:10],
+    }
+
+def run_stress(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"mode": "stress", "backend": args.backend, "threads": args.threads,
+                   "stress_ops": args.stress_ops, "seed": args.seed},
+        "runs": [],
+    }
+    print(f"  {'книг':>9} {'потоков':>8} {'операций':>9} {'оп/с':>10} {'нарушений':>10}")
+    for size in args.sizes:
+        for threads in args.threads:
+            result = stress_size(args, size, threads)
+            print(f"  {size:>9,} {threads:>8} {result['operations']:>9} "
+                  f"{result['ops_per_sec']:>10,.0f} {result['violations']:>10}")
+            for sample in result["violation_samples"]:
+                print(f"    ! {sample}")
+            report["runs"].append(result)
+    return report
+
+def print_result(result: Dict[str, Any]) -> None:
+    overall = result["overall"]
+    print(f"\nКаталог {result['size']:,} книг: {result['requests']} запросов за {result['seconds']:.2f} с "
+          f"= {result['throughput_rps']:,.0f} запр/с, ошибок {overall['errors']}")
+    print(f"  {'операция':<8} {'кол-во':>8} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}")
+    for name, stats in list(result["operations"].items()) + [("всего", overall)]:
+        print(f"  {name:<8} {stats['count']:>8} {stats['p50_ms']:>9.2f} "
+              f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "backend": args.backend,
+            "transport": "uvicorn" if args.uvicorn else "asgi",
+            "mix": args.mix,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "list_limit": args.list_limit,
+            "seed": args.seed,
+        },
+        "runs": [],
+    }
+    for size in args.sizes:
+        if args.uvicorn:
+            with UvicornThread(args.host, args.port):
+                result = await bench_size(args, size, f"http://{args.host}:{args.port}")
+        else:
+            result = await bench_size(args, size, None)
+        print_result(result)
+        report["runs"].append(result)
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Library API (lab5)")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        type=lambda text: [int(float(size)) for size in text.split(",")],
+                        help="размеры каталога через запятую (например 1e3,1e6)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="веса операций: list=5,get=40,search=20,create=15,update=15,delete=5")
+    parser.add_argument("--requests", type=int, default=10000, help="запросов на каждый размер")
+    parser.add_argument("--warmup", type=int, default=500, help="запросов на прогрев (не учитываются)")
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных клиентов")
+    parser.add_argument("--list-limit", type=int, default=100, help="размер страницы для list")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--uvicorn", action="store_true", help="через локальный uvicorn вместо ASGI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json", help="файл для результатов (JSON)")
+    parser.add_argument("--stress", action="store_true",
+                        help="проверка хранилища под конкуренцией потоков вместо HTTP-нагрузки")
+    parser.add_argument("--threads", default="1,4,16", type=lambda text: [int(n) for n in text.split(",")],
+                        help="число потоков для --stress через запятую")
+    parser.add_argument("--stress-ops", type=int, default=20000, help="операций на поток для --stress")
+    args = parser.parse_args()
+
+    report = run_stress(args) if args.stress else asyncio.run(run_benchmark(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+if __name__ == "__main__":
+    main()